@@ -15,6 +15,10 @@ def create_app():
     init_db(app)
 
     with app.app_context():
+        # pragmas and transaction modes must be in place before the first connection
+        from models.sqlite import init_sqlite, install_sqlite_triggers
+        init_sqlite(app)
+
         from models import schema  # noqa: F401, ensure models are registered
         db.create_all()
 
@@ -22,6 +26,21 @@ def create_app():
         from models.operations import ensure_default_rooms
         ensure_default_rooms()
 
+        # schema and rooms for every additional club site
+        from models.sites import init_sites
+        init_sites(app)
+
+        # SQLite versions of the setup.sql triggers
+        install_sqlite_triggers()
+
+        # live update broker for the SSE stream
+        from models.events import init_events
+        init_events(app)
+
+        # request/statement timing for /metrics and the slow-query log
+        from app.metrics import init_metrics
+        init_metrics(app)
+
     from app.routes import bp as main_bp
     app.register_blueprint(main_bp)
 
@@ -0,0 +1,482 @@
+"""
+Prometheus-style metrics and slow-query logging.
+
+Request timing hooks into Flask, statement timing hooks into SQLAlchemy
+engine events. Everything is kept in process and rendered in the
+Prometheus text format by render(). With METRICS_DIR set, as under gunicorn,
+each worker also writes its values there every few seconds and render()
+adds up all workers, so /metrics reports the same totals whichever worker
+answers it.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine.interfaces import CacheStats
+
+from models import db
+from models.reports import roster_cache_stats
+
+slow_query_log = logging.getLogger("fitness_club.slow_query")
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, into, values, pid):
+        for labels, value in values.items():
+            into[labels] = into.get(labels, 0) + value
+
+    def render(self, values=None, per_process=False):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        values = self.snapshot() if values is None else values
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """
+    Metric whose value is read from a callback at render time. With label
+    names the callback returns a {labels: value} dict. Across processes
+    counter-kind values are added up and gauges get a pid label.
+    """
+
+    def __init__(self, name, help_text, read, label_names=(), kind="gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+        self.label_names = label_names
+        self.kind = kind
+
+    def snapshot(self):
+        if not self.label_names:
+            return {(): self.read()}
+        return dict(self.read())
+
+    def merge(self, into, values, pid):
+        for labels, value in values.items():
+            if self.kind != "gauge":
+                into[labels] = into.get(labels, 0) + value
+            elif pid is not None:
+                # a gauge of a process that has exited no longer means anything
+                into[labels + (str(pid),)] = value
+
+    def render(self, values=None, per_process=False):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        values = self.snapshot() if values is None else values
+        label_names = self.label_names
+        if per_process and self.kind == "gauge":
+            label_names += ("pid",)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    def merge(self, into, values, pid):
+        for labels, series in values.items():
+            current = into.get(labels)
+            into[labels] = list(series) if current is None else [a + b for a, b in zip(current, series)]
+
+    def render(self, values=None, per_process=False):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        values = self.snapshot() if values is None else values
+        for labels, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{_format_labels(self.label_names + ('le',), labels + (bound,))} {cumulative}"
+                )
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {series[-1]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+REQUEST_COUNT = Counter(
+    "http_requests_total", "HTTP requests by endpoint, method and status.",
+    ("endpoint", "method", "status"),
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint.",
+    ("endpoint", "method"),
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds", "Time spent in database statements per request.",
+    ("endpoint",),
+)
+DB_STATEMENTS = Counter("db_statements_total", "SQL statements executed.")
+DB_LATENCY = Histogram("db_statement_duration_seconds", "SQL statement latency.")
+DB_SLOW = Counter("db_slow_statements_total", "Statements slower than SLOW_QUERY_MS.")
+POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+STATEMENT_CACHE = Counter(
+    "sqlalchemy_compiled_cache_total", "SQLAlchemy compiled statement cache lookups.",
+    ("result",),
+)
+
+_collectors = [
+    REQUEST_COUNT,
+    REQUEST_LATENCY,
+    REQUEST_DB_TIME,
+    DB_STATEMENTS,
+    DB_LATENCY,
+    DB_SLOW,
+    POOL_WAIT,
+    STATEMENT_CACHE,
+    Gauge(
+        "roster_cache_total", "Roster progress cache lookups.",
+        lambda: {(result,): count for result, count in roster_cache_stats.items()},
+        label_names=("result",),
+        kind="counter",
+    ),
+]
+
+_CACHE_RESULTS = {CacheStats.CACHE_HIT: ("hit",), CacheStats.CACHE_MISS: ("miss",)}
+
+_state = threading.local()
+
+# directory the worker processes share their values through, see METRICS_DIR
+_shared_dir = None
+FLUSH_SECONDS = 5.0
+ARCHIVE = "archive.json"
+
+
+def register(collector):
+    """
+    Add a Counter, Gauge or Histogram to the /metrics output.
+    """
+    _collectors.append(collector)
+    return collector
+
+
+def render():
+    if _shared_dir is None:
+        values = {collector.name: None for collector in _collectors}
+    else:
+        values = _merged_values()
+    lines = []
+    for collector in _collectors:
+        lines.extend(collector.render(values[collector.name], per_process=_shared_dir is not None))
+    return "\n".join(lines) + "\n"
+
+
+# ---------- worker processes ----------
+
+def _snapshot():
+    return {
+        collector.name: [[list(labels), value] for labels, value in collector.snapshot().items()]
+        for collector in _collectors
+    }
+
+
+def _read_snapshot(filename):
+    try:
+        with open(os.path.join(_shared_dir, filename)) as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        # the process exited and was archived in the meantime
+        return {}
+    return {name: {tuple(labels): value for labels, value in items} for name, items in data.items()}
+
+
+def _write_snapshot(filename, data):
+    tmp = os.path.join(_shared_dir, f".{filename}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, os.path.join(_shared_dir, filename))
+
+
+def _merged_values():
+    """
+    This process's live values plus every other worker's last snapshot and
+    the archive of exited workers, per collector name.
+    """
+    pid = os.getpid()
+    values = {collector.name: {} for collector in _collectors}
+    snapshots = [(pid, {collector.name: collector.snapshot() for collector in _collectors})]
+    for filename in sorted(os.listdir(_shared_dir)):
+        if filename == ARCHIVE:
+            snapshots.append((None, _read_snapshot(filename)))
+        elif filename[:-5].isdigit() and filename != f"{pid}.json":
+            snapshots.append((int(filename[:-5]), _read_snapshot(filename)))
+    for process, snapshot in snapshots:
+        for collector in _collectors:
+            collector.merge(values[collector.name], snapshot.get(collector.name, {}), process)
+    return values
+
+
+def flush_metrics():
+    """
+    Write this process's values to METRICS_DIR for the other workers' /metrics.
+    """
+    if _shared_dir is not None:
+        _write_snapshot(f"{os.getpid()}.json", _snapshot())
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        try:
+            flush_metrics()
+        except OSError:
+            logger.exception("Could not write metrics to %s", _shared_dir)
+
+
+def share_metrics():
+    """
+    Flush this process's values every FLUSH_SECONDS. Call in each worker
+    after fork; the thread does not survive forking.
+    """
+    if _shared_dir is not None:
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def retire_process(pid):
+    """
+    Fold the last snapshot of an exited worker into the archive, so counters
+    keep its counts and a new process reusing the pid starts from zero.
+    Call in the parent process only, one exit at a time.
+    """
+    if _shared_dir is None:
+        return
+    filename = f"{pid}.json"
+    archive = _read_snapshot(ARCHIVE)
+    exited = _read_snapshot(filename)
+    merged = {}
+    for collector in _collectors:
+        values = {}
+        collector.merge(values, archive.get(collector.name, {}), None)
+        collector.merge(values, exited.get(collector.name, {}), None)
+        merged[collector.name] = [[list(labels), value] for labels, value in values.items()]
+    _write_snapshot(ARCHIVE, merged)
+    try:
+        os.remove(os.path.join(_shared_dir, filename))
+    except FileNotFoundError:
+        pass
+
+
+def clear_shared_metrics():
+    """
+    Remove the snapshots of a previous server run from METRICS_DIR.
+    """
+    if _shared_dir is None:
+        return
+    for filename in os.listdir(_shared_dir):
+        if filename.endswith(".json") or filename.endswith(".tmp"):
+            os.remove(os.path.join(_shared_dir, filename))
+
+
+# ---------- request timing ----------
+
+def _before_request():
+    g._metrics_start = time.perf_counter()
+    g._metrics_db_time = 0.0
+
+
+def _after_request(response):
+    g._metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(exc):
+    start = g.pop("_metrics_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    endpoint = request.endpoint or "unknown"
+    status = g.pop("_metrics_status", 500)
+
+    REQUEST_COUNT.inc((endpoint, request.method, str(status)))
+    REQUEST_LATENCY.observe((endpoint, request.method), elapsed)
+    REQUEST_DB_TIME.observe((endpoint,), g.pop("_metrics_db_time", 0.0))
+
+
+# ---------- statement timing ----------
+
+def _call_site():
+    """
+    Find the innermost frame in models/operations.py, falling back to the
+    first frame outside SQLAlchemy and this module.
+    """
+    fallback = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.endswith(os.path.join("models", "operations.py")):
+            return f"{filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+        if fallback is None and "sqlalchemy" not in filename and filename != __file__:
+            fallback = f"{filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return fallback
+
+
+def _truncate(text, limit=1000):
+    return text if len(text) <= limit else text[:limit] + f"... ({len(text)} chars)"
+
+
+def _explain(engine, conn, statement, parameters):
+    _state.explaining = True
+    try:
+        if engine.dialect.name == "sqlite":
+            # a failed EXPLAIN does not abort a SQLite transaction, and the
+            # tuned SQLite writer has no second connection to wait for
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        else:
+            # separate connection so a failed EXPLAIN cannot poison the caller's transaction
+            with engine.connect() as explain_conn:
+                rows = explain_conn.exec_driver_sql("EXPLAIN " + statement, parameters).fetchall()
+        return "\n".join(" ".join(str(col) for col in row) for row in rows)
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+    finally:
+        _state.explaining = False
+
+
+def _instrument_engine(engine, slow_seconds, explain):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_start", None)
+        if start is None or getattr(_state, "explaining", False):
+            return
+        elapsed = time.perf_counter() - start
+
+        DB_STATEMENTS.inc()
+        DB_LATENCY.observe((), elapsed)
+        cache_result = _CACHE_RESULTS.get(context.cache_hit)
+        if cache_result:
+            STATEMENT_CACHE.inc(cache_result)
+        if has_request_context():
+            g._metrics_db_time = g.get("_metrics_db_time", 0.0) + elapsed
+
+        if slow_seconds is not None and elapsed >= slow_seconds:
+            DB_SLOW.inc()
+            plan = None
+            if explain and statement.lstrip().upper().startswith("SELECT"):
+                plan = _explain(engine, conn, statement, parameters)
+            slow_query_log.warning(
+                "Slow query %.1f ms at %s\n%s\nparams: %s%s",
+                elapsed * 1000,
+                _call_site(),
+                statement,
+                _truncate(repr(parameters)),
+                f"\nplan:\n{plan}" if plan else "",
+            )
+
+    _instrument_pool(engine)
+
+    @event.listens_for(engine, "engine_disposed")
+    def engine_disposed(engine):
+        # dispose() replaces the pool, so wrap the new one as well
+        _instrument_pool(engine)
+
+
+def _instrument_pool(engine):
+    pool = engine.pool
+    if getattr(pool, "_metrics_wrapped", False):
+        return
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            POOL_WAIT.observe((), time.perf_counter() - start)
+
+    pool.connect = timed_connect
+    pool._metrics_wrapped = True
+
+
+def init_metrics(app):
+    """
+    Install request and statement instrumentation when METRICS_ENABLED is set.
+    Must be called inside an app context after init_db().
+    """
+    if not app.config.get("METRICS_ENABLED", True):
+        return False
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+    slow_ms = app.config.get("SLOW_QUERY_MS")
+    slow_seconds = slow_ms / 1000.0 if slow_ms is not None else None
+    explain = app.config.get("SLOW_QUERY_EXPLAIN", False)
+    for engine in db.engines.values():
+        _instrument_engine(engine, slow_seconds, explain)
+
+    global _shared_dir
+    _shared_dir = app.config.get("METRICS_DIR")
+    if _shared_dir is not None:
+        os.makedirs(_shared_dir, exist_ok=True)
+
+    app.extensions["metrics"] = True
+    return True
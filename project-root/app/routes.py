@@ -1,10 +1,32 @@
+import json
+import logging
+import queue
+from contextlib import nullcontext
+
 from flask import (
     Blueprint,
+    Response,
+    current_app,
+    jsonify,
     render_template,
     request,
     redirect,
     url_for,
     flash,
+    g,
+)
+
+from sqlalchemy import text
+
+from app import metrics
+from models import db, events, current_site, write_intent
+from models.sites import (
+    default_site,
+    get_sites,
+    is_multi_site,
+    get_admin_totals,
+    search_members_all_sites,
+    use_site,
 )
 
 from models.operations import (
@@ -27,16 +49,103 @@ from models.operations import (
     register_member_for_class,
     update_class_session_room,
     update_pt_session_room,
+    reassign_room_closure,
+    get_class_seat_counts,
 )
+from models.reports import get_trainer_utilization_report, get_roster_progress
+from models.jobs import enqueue_job, get_recent_jobs, get_job
+from models.retention import get_retention_matrix
+from models.changes import get_changes
 
 bp = Blueprint("main", __name__)
 
+logger = logging.getLogger(__name__)
+
+
+@bp.before_request
+def select_site():
+    site = request.cookies.get("site")
+    if site and site != default_site() and site in get_sites():
+        g._site_token = current_site.set(site)
+
+
+@bp.before_request
+def mark_writes():
+    # anything but a read goes to the write connection for its whole transaction
+    if request.method not in ("GET", "HEAD", "OPTIONS"):
+        g._write_token = write_intent.set(True)
+
+
+@bp.teardown_request
+def release_site(exc):
+    token = g.pop("_site_token", None)
+    if token is not None:
+        db.session.remove()
+        current_site.reset(token)
+    token = g.pop("_write_token", None)
+    if token is not None:
+        write_intent.reset(token)
+
+
+@bp.app_context_processor
+def inject_sites():
+    return {
+        "sites": get_sites() if is_multi_site() else [],
+        "selected_site": current_site.get() or default_site(),
+        # what events carry in their "site" field; None for the default database
+        "site_key": current_site.get(),
+    }
+
+
+@bp.route("/site", methods=["POST"])
+def select_site_route():
+    site = request.form.get("site")
+    response = redirect(request.referrer or url_for("main.home"))
+    if site in get_sites():
+        response.set_cookie("site", site, samesite="Lax")
+    else:
+        flash("Unknown site.")
+    return response
+
 
 @bp.route("/")
 def home():
     return render_template("home.html")
 
 
+@bp.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+@bp.route("/readyz", methods=["GET"])
+def readyz():
+    """
+    Ready when every configured database answers a trivial query.
+    """
+    databases = {}
+    for key, engine in db.engines.items():
+        name = key or "default"
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            databases[name] = "ok"
+        except Exception:
+            logger.exception("Readiness check failed for database %s.", name)
+            databases[name] = "error"
+
+    if all(status == "ok" for status in databases.values()):
+        return jsonify({"status": "ready", "databases": databases})
+    return jsonify({"status": "unavailable", "databases": databases}), 503
+
+
+@bp.route("/metrics", methods=["GET"])
+def metrics_route():
+    if not current_app.extensions.get("metrics"):
+        return Response("Metrics are disabled.", status=404)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 # ---------- Member portal ----------
 
 @bp.route("/member", methods=["GET"])
@@ -45,6 +154,7 @@ def member_portal():
     member_id = request.args.get("member_id", type=int)
     dashboard_data = None
     upcoming_classes = get_upcoming_classes()
+    seat_counts = get_class_seat_counts([c.id for c in upcoming_classes])
 
     if member_id:
         try:
@@ -58,6 +168,8 @@ def member_portal():
         selected_member_id=member_id,
         dashboard_data=dashboard_data,
         upcoming_classes=upcoming_classes,
+        seat_counts=seat_counts,
+        live_updates=events.enabled(),
     )
 
 
@@ -133,6 +245,41 @@ def member_class_register_route():
     return redirect(url_for("main.member_portal", member_id=member_id))
 
 
+@bp.route("/events", methods=["GET"])
+def events_stream():
+    """
+    Server-Sent Events stream of seat counts and class/PT session changes.
+    """
+    subscription = events.subscribe()
+    if subscription is None:
+        return Response("Live updates are disabled.", status=404)
+    if not events.acquire_stream():
+        # every open stream holds a worker thread; keep some for page requests
+        events.unsubscribe(subscription)
+        return Response("Too many live update streams.", status=503, headers={"Retry-After": "30"})
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event, payload = subscription.get(timeout=15)
+                except queue.Empty:
+                    # keep proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {payload}\n\n"
+        finally:
+            events.unsubscribe(subscription)
+            events.release_stream()
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ---------- Trainer portal ----------
 
 @bp.route("/trainer", methods=["GET"])
@@ -150,7 +297,10 @@ def trainer_portal():
             flash(str(e))
 
     if search_term:
-        member_results = search_members_by_name(search_term)
+        if is_multi_site():
+            member_results = search_members_all_sites(search_term)
+        else:
+            member_results = search_members_by_name(search_term)
 
     return render_template(
         "trainer_portal.html",
@@ -162,6 +312,67 @@ def trainer_portal():
     )
 
 
+@bp.route("/trainer/roster", methods=["GET"])
+def trainer_roster():
+    trainer_id = request.args.get("trainer_id", type=int)
+    rows = []
+
+    try:
+        rows = get_roster_progress(trainer_id)
+    except ValueError as e:
+        flash(str(e))
+
+    return render_template(
+        "trainer_roster.html",
+        trainers=get_all_trainers(),
+        selected_trainer_id=trainer_id,
+        rows=rows,
+    )
+
+
+@bp.route("/api/roster", methods=["GET"])
+def roster_api():
+    trainer_id = request.args.get("trainer_id", type=int)
+    try:
+        return jsonify(get_roster_progress(trainer_id))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+
+
+@bp.route("/api/changes", methods=["GET"])
+def changes_api():
+    """
+    Change feed for downstream sync. Pass the returned cursor back as
+    `after` to get the next batch; `site` picks a club site's log.
+    """
+    after = request.args.get("after", 0, type=int)
+    limit = max(1, min(request.args.get("limit", 100, type=int), 1000))
+    site = request.args.get("site")
+
+    try:
+        with use_site(site) if site else nullcontext():
+            changes, has_more = get_changes(after, limit)
+            return jsonify(
+                {
+                    "changes": [
+                        {
+                            "id": change.id,
+                            "entity": change.entity,
+                            "entity_id": change.entity_id,
+                            "action": change.action,
+                            "data": json.loads(change.data) if change.data else None,
+                            "created_at": change.created_at.isoformat(),
+                        }
+                        for change in changes
+                    ],
+                    "cursor": changes[-1].id if changes else after,
+                    "has_more": has_more,
+                }
+            )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+
+
 @bp.route("/trainer/availability", methods=["POST"])
 def trainer_availability_route():
     trainer_id = request.form.get("trainer_id", type=int)
@@ -184,6 +395,7 @@ def admin_portal():
     data = get_admin_portal_data()
     return render_template(
         "admin_portal.html",
+        site_totals=get_admin_totals() if is_multi_site() else None,
         trainers=data["trainers"],
         rooms=data["rooms"],
         members=data["members"],
@@ -193,6 +405,84 @@ def admin_portal():
     )
 
 
+@bp.route("/admin/utilization", methods=["GET"])
+def admin_utilization():
+    start = request.args.get("start", "")
+    end = request.args.get("end", "")
+    period = request.args.get("period", "week")
+    report = None
+
+    if start and end:
+        try:
+            report = get_trainer_utilization_report(start, end, period)
+        except ValueError as e:
+            flash(str(e))
+
+    return render_template(
+        "trainer_utilization.html",
+        start=start,
+        end=end,
+        period=period,
+        report=report,
+    )
+
+
+@bp.route("/admin/retention", methods=["GET"])
+def admin_retention():
+    max_weeks = request.args.get("weeks", 12, type=int)
+    return render_template(
+        "admin_retention.html",
+        matrix=get_retention_matrix(max(1, min(max_weeks, 52))),
+    )
+
+
+@bp.route("/admin/jobs", methods=["GET"])
+def admin_jobs():
+    return render_template("admin_jobs.html", jobs=get_recent_jobs())
+
+
+@bp.route("/admin/jobs", methods=["POST"])
+def admin_jobs_enqueue_route():
+    kind = request.form.get("kind")
+    payload = {
+        key: value
+        for key, value in request.form.items()
+        if key != "kind" and value
+    }
+
+    try:
+        job = enqueue_job(kind, payload)
+        flash(f"Job #{job.id} queued.")
+    except ValueError as e:
+        flash(str(e))
+
+    return redirect(url_for("main.admin_jobs"))
+
+
+@bp.route("/admin/jobs/<int:job_id>", methods=["GET"])
+def admin_job_detail(job_id):
+    try:
+        job = get_job(job_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+
+    return jsonify(
+        {
+            "id": job.id,
+            "kind": job.kind,
+            "status": job.status,
+            "attempts": job.attempts,
+            "progress": job.progress,
+            "message": job.message,
+            "error": job.error,
+            "result": json.loads(job.result) if job.result else None,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+    )
+
+
 @bp.route("/admin/trainer", methods=["POST"])
 def admin_trainer_route():
     name = request.form.get("name")
@@ -289,3 +579,27 @@ def admin_ptsession_update_room_route(pt_id):
     except ValueError as e:
         flash(str(e))
     return redirect(url_for("main.admin_portal"))
+
+
+@bp.route("/admin/room/close", methods=["POST"])
+def admin_room_close_route():
+    room_id = request.form.get("room_id", type=int)
+    start_time = request.form.get("start_time")
+    end_time = request.form.get("end_time")
+
+    try:
+        result = reassign_room_closure(room_id, start_time, end_time)
+        if result["unplaced"]:
+            flash(f"No rooms changed: {len(result['unplaced'])} session(s) could not be placed.")
+            for row in result["unplaced"][:20]:
+                label = "Class" if row.kind == "class" else "PT session"
+                flash(f"{label} #{row.id} ({row.start_time} to {row.end_time}, size {row.size}) has no free room.")
+        elif result["moved"]:
+            flash(f"Moved {result['moved']} session(s) out of the closed room.")
+        else:
+            flash("No sessions are booked in that room during this time.")
+    except ValueError as e:
+        flash(str(e))
+
+    return redirect(url_for("main.admin_portal"))
+
@@ -0,0 +1,279 @@
+"""
+Per-call CPU cost of the hot operation queries, building the statement on
+every call versus executing the prebuilt statements in models/operations.py:
+
+    python bench_statements.py --iterations 5000
+    python bench_statements.py --database postgresql+psycopg://localhost/fitness_bench
+
+Both variants run the same SQL against the same rows, so the difference is
+the Python time spent constructing the expression and looking it up in the
+compiled cache. Without --database a temporary SQLite file is used; a real
+database gets extra seed rows on every run.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+# ---------- seeding ----------
+
+def seed(app, tag):
+    from sqlalchemy import insert, select
+
+    from models import db
+    from models.schema import (
+        Member,
+        Trainer,
+        Room,
+        ClassSession,
+        ClassRegistration,
+        TrainerAvailability,
+    )
+
+    with app.app_context():
+        db.session.execute(
+            insert(Member),
+            [{"name": f"Bench {tag} {i}", "email": f"bench{tag}-{i}@example.com"} for i in range(200)],
+        )
+        db.session.execute(
+            insert(Trainer),
+            [{"name": f"Coach {tag} {i}", "email": f"coach{tag}-{i}@example.com"} for i in range(10)],
+        )
+        members = db.session.scalars(select(Member.id).where(Member.email.like(f"bench{tag}-%"))).all()
+        trainers = db.session.scalars(select(Trainer.id).where(Trainer.email.like(f"coach{tag}-%"))).all()
+        rooms = db.session.scalars(select(Room.id)).all()
+
+        start = datetime.utcnow().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        db.session.execute(
+            insert(ClassSession),
+            [
+                {
+                    "title": f"Bench class {i}",
+                    "trainer_id": trainers[i % len(trainers)],
+                    "room_id": rooms[i % len(rooms)],
+                    "start_time": start + timedelta(hours=i),
+                    "end_time": start + timedelta(hours=i, minutes=50),
+                    "capacity": 20,
+                }
+                for i in range(500)
+            ],
+        )
+        db.session.execute(
+            insert(TrainerAvailability),
+            [
+                {"trainer_id": t, "start_time": start, "end_time": start + timedelta(days=60)}
+                for t in trainers
+            ],
+        )
+        classes = db.session.scalars(
+            select(ClassSession.id)
+            .where(ClassSession.title.like("Bench class %"))
+            .order_by(ClassSession.id.desc())
+            .limit(500)
+        ).all()
+        db.session.execute(
+            insert(ClassRegistration),
+            [
+                {"member_id": m, "class_session_id": classes[i % 50], "registered_at": datetime.utcnow()}
+                for i, m in enumerate(members)
+            ],
+        )
+        db.session.commit()
+        return {
+            "member_id": members[0],
+            "trainer_id": trainers[0],
+            "room_id": rooms[0],
+            "class_session_id": classes[-1],
+            "class_ids": classes[:20],
+            "start": start + timedelta(hours=3, minutes=10),
+            "end": start + timedelta(hours=4),
+        }
+
+
+# ---------- cases ----------
+
+def cases(ids):
+    """
+    (name, built per call, prebuilt) pairs of zero-argument callables.
+    The per-call variants are the statements as operations.py built them
+    before they were cached.
+    """
+    from sqlalchemy import exists, false, func, not_, select, true
+
+    from models import db
+    from models import operations as ops
+    from models.schema import (
+        Member,
+        Trainer,
+        Room,
+        ClassSession,
+        ClassRegistration,
+        HealthMetric,
+        TrainerAvailability,
+    )
+
+    member_id, trainer_id, room_id = ids["member_id"], ids["trainer_id"], ids["room_id"]
+    class_id, start, end = ids["class_session_id"], ids["start"], ids["end"]
+    execute = db.session.execute
+
+    def registration_built():
+        registered = (
+            select(func.count(ClassRegistration.id))
+            .where(ClassRegistration.class_session_id == class_id)
+            .scalar_subquery()
+        )
+        capacity = select(ClassSession.capacity).where(ClassSession.id == class_id).scalar_subquery()
+        return execute(
+            ops.validation_query(
+                [
+                    (ops._row_exists(Member, member_id), "member_not_found"),
+                    (ops._row_exists(ClassSession, class_id), "class_not_found"),
+                    (
+                        not_(
+                            exists().where(
+                                ClassRegistration.member_id == member_id,
+                                ClassRegistration.class_session_id == class_id,
+                            )
+                        ),
+                        "already_registered",
+                    ),
+                    (registered < capacity, "class_full"),
+                ]
+            )
+        ).scalar()
+
+    def registration_cached():
+        return execute(
+            ops.REGISTRATION_CHECK, {"member_id": member_id, "class_session_id": class_id}
+        ).scalar()
+
+    def pt_check_built():
+        return execute(
+            ops.validation_query(
+                [
+                    (ops._row_exists(Member, member_id), "member_not_found"),
+                    (ops._row_exists(Trainer, trainer_id), "trainer_not_found"),
+                    (ops._row_exists(Room, room_id), "room_not_found"),
+                    (true() if start < end else false(), "invalid_range"),
+                    (
+                        exists().where(
+                            TrainerAvailability.trainer_id == trainer_id,
+                            TrainerAvailability.start_time <= start,
+                            TrainerAvailability.end_time >= end,
+                        ),
+                        "trainer_unavailable",
+                    ),
+                    (not_(ops.room_conflict_clause(room_id, start, end)), "room_conflict"),
+                    (not_(ops.trainer_conflict_clause(trainer_id, start, end)), "trainer_conflict"),
+                ]
+            )
+        ).scalar()
+
+    def pt_check_cached():
+        return execute(
+            ops.PT_SESSION_CHECK,
+            {
+                "member_id": member_id,
+                "trainer_id": trainer_id,
+                "room_id": room_id,
+                **ops._range_params(start, end),
+            },
+        ).scalar()
+
+    def conflict_built():
+        return execute(select(ops.room_conflict_clause(room_id, start, end))).scalar()
+
+    def conflict_cached():
+        return ops.check_room_conflict(room_id, start, end)
+
+    def seats_built():
+        return dict(
+            db.session.query(ClassRegistration.class_session_id, func.count(ClassRegistration.id))
+            .filter(ClassRegistration.class_session_id.in_(ids["class_ids"]))
+            .group_by(ClassRegistration.class_session_id)
+            .all()
+        )
+
+    def seats_cached():
+        return ops.get_class_seat_counts(ids["class_ids"])
+
+    def latest_metric_built():
+        return (
+            HealthMetric.query.filter_by(member_id=member_id)
+            .order_by(HealthMetric.recorded_at.desc())
+            .first()
+        )
+
+    def latest_metric_cached():
+        return execute(ops.LATEST_METRIC, {"member_id": member_id}).scalar()
+
+    def upcoming_built():
+        now = datetime.utcnow()
+        return ops.fetch(ops.ClassRow, ops.class_rows_query().where(ClassSession.start_time >= now))
+
+    def upcoming_cached():
+        return ops.get_upcoming_classes()
+
+    # the per-call variants must see the same rows as the cached ones
+    assert registration_built() == registration_cached()
+    assert pt_check_built() == pt_check_cached()
+    assert conflict_built() == conflict_cached()
+    assert seats_built() == seats_cached()
+
+    return [
+        ("register check", registration_built, registration_cached),
+        ("pt booking check", pt_check_built, pt_check_cached),
+        ("room conflict", conflict_built, conflict_cached),
+        ("seat counts", seats_built, seats_cached),
+        ("latest metric", latest_metric_built, latest_metric_cached),
+        ("upcoming classes", upcoming_built, upcoming_cached),
+    ]
+
+
+def cpu_per_call(fn, iterations):
+    for _ in range(min(iterations, 50)):
+        fn()
+    started = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prebuilt versus per-call statements.")
+    parser.add_argument("--database", help="SQLAlchemy URL; defaults to a temporary SQLite file")
+    parser.add_argument("--iterations", type=int, default=2000, help="calls per variant")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.database:
+        os.environ["DATABASE_URL"] = args.database
+    else:
+        tmpdir = tempfile.mkdtemp(prefix="fitness-bench-")
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmpdir, "bench.db")
+    # config is read from the environment at import time
+    os.environ.setdefault("SLOW_QUERY_MS", "off")
+    os.environ.setdefault("METRICS_ENABLED", "false")
+
+    from app import create_app
+
+    try:
+        app = create_app()
+        ids = seed(app, int(time.time()))
+        print(f"{os.environ['DATABASE_URL']}, {args.iterations} calls per variant, CPU time per call\n")
+        print(f"{'query':<18} {'built us':>9} {'cached us':>10} {'saved':>7}")
+        with app.app_context():
+            for name, built, cached in cases(ids):
+                before = cpu_per_call(built, args.iterations) * 1e6
+                after = cpu_per_call(cached, args.iterations) * 1e6
+                print(f"{name:<18} {before:>9.1f} {after:>10.1f} {1 - after / before:>7.0%}")
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Production server settings:
+
+    gunicorn -c gunicorn.conf.py
+
+The app is loaded once in the master and forked into WEB_CONCURRENCY worker
+processes with WEB_THREADS threads each. Every open /events stream holds one
+of those threads, so at most half of them serve streams (EVENT_STREAM_LIMIT
+overrides this); for many live clients use an async worker instead:
+
+    pip install gevent
+    WORKER_CLASS=gevent gunicorn -c gunicorn.conf.py
+
+Each worker keeps its own /metrics values and shares them through files in
+METRICS_DIR (a temporary directory unless set), so whichever worker answers
+/metrics reports the totals of all of them, including workers that have
+been replaced since the server started.
+
+Signals to the master:
+
+    HUP   re-read this file and replace workers, letting old ones finish
+          their requests (preloaded code is not re-imported; use USR2 then
+          QUIT on the old master to deploy new code without downtime)
+    TERM  stop accepting connections and drain for up to GRACEFUL_TIMEOUT
+"""
+import multiprocessing
+import os
+import tempfile
+
+wsgi_app = "run:app"
+bind = os.environ.get("BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("WEB_THREADS", 4))
+# threaded workers keep long-lived /events streams from tying up a whole process
+worker_class = os.environ.get("WORKER_CLASS") or ("gthread" if threads > 1 else "sync")
+
+timeout = int(os.environ.get("WORKER_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("KEEPALIVE", 5))
+# recycle workers now and then so slow leaks cannot build up
+max_requests = int(os.environ.get("MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", 1000))
+
+preload_app = True
+
+# read by config.py when the app is loaded, after this file
+if not os.environ.get("METRICS_DIR"):
+    os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="fitness-club-metrics-")
+
+accesslog = os.environ.get("ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    # counts left in METRICS_DIR by a previous run are not this server's
+    from app.metrics import clear_shared_metrics
+
+    clear_shared_metrics()
+
+
+def post_fork(server, worker):
+    """
+    Give each worker its own database connections and event broker. Pooled
+    connections opened in the master while preloading must not be shared
+    with the children, and neither the broker's listener thread nor the
+    metrics flush thread survives fork.
+    """
+    from run import app
+    from models import db
+    from models.events import init_events
+    from app.metrics import share_metrics
+
+    if worker_class in ("gthread", "sync") and app.config.get("EVENT_STREAM_LIMIT") is None:
+        # a sync worker has no thread to spare, so it serves no streams at all
+        app.config["EVENT_STREAM_LIMIT"] = threads // 2 if worker_class == "gthread" else 0
+
+    with app.app_context():
+        for engine in db.engines.values():
+            # close=False leaves the master's sockets alone instead of closing them from here
+            engine.dispose(close=False)
+        init_events(app, processes=workers)
+        share_metrics()
+
+
+def worker_exit(server, worker):
+    # runs in the worker; counts since its last periodic flush would be lost
+    from app.metrics import flush_metrics
+
+    flush_metrics()
+
+
+def child_exit(server, worker):
+    # runs in the master once the worker is gone
+    from app.metrics import retire_process
+
+    retire_process(worker.pid)
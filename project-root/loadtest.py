@@ -0,0 +1,409 @@
+"""
+HTTP load test with a club-like workload.
+
+Seeds members, trainers, availability and one popular class, serves the app
+from an in-process threaded server (or targets --url), and drives a weighted
+mix of routes from many client threads:
+
+    python loadtest.py --concurrency 32 --duration 30
+    python loadtest.py --mix dashboard=50,class_rush=50 --capacity 20
+    python loadtest.py --database postgresql+psycopg2://localhost/fitness_load
+    python loadtest.py --url http://localhost:8000 --database postgresql+psycopg2://localhost/fitness_load
+
+Without --database a temporary SQLite file is used. A real database gets
+extra seed rows on every run, so point it at a scratch database. --url
+needs --database set to the server's own database, since the seeded ids
+and the consistency checks must match what the server sees.
+"""
+import argparse
+import logging
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+DEFAULT_MIX = "dashboard=35,class_rush=25,metric=20,pt_booking=10,admin=5,trainer=5"
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # the app answers every form post with a redirect; count it, don't follow it
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+_opener = urllib.request.build_opener(_NoRedirect)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# ---------- seeding ----------
+
+def seed(app, members, trainers, capacity, tag):
+    """
+    Insert this run's rows and return the ids the operations pick from.
+    """
+    from sqlalchemy import func, insert, select
+
+    from models import db
+    from models.schema import (
+        Member,
+        Trainer,
+        Room,
+        ClassSession,
+        PTSession,
+        TrainerAvailability,
+    )
+
+    with app.app_context():
+        db.session.execute(
+            insert(Member),
+            [
+                {"name": f"Load Member {i}", "email": f"load{tag}-{i}@example.com", "created_at": datetime.utcnow()}
+                for i in range(members)
+            ],
+        )
+        db.session.execute(
+            insert(Trainer),
+            [{"name": f"Load Trainer {i}", "email": f"load{tag}-t{i}@example.com"} for i in range(trainers)],
+        )
+        member_ids = db.session.scalars(
+            select(Member.id).where(Member.email.like(f"load{tag}-%"))
+        ).all()
+        trainer_ids = db.session.scalars(
+            select(Trainer.id).where(Trainer.email.like(f"load{tag}-%"))
+        ).all()
+        room_ids = db.session.scalars(select(Room.id).order_by(Room.id)).all()
+
+        # a week of 06:00-22:00 availability for every trainer, starting tomorrow
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        days = [today + timedelta(days=d) for d in range(1, 8)]
+        db.session.execute(
+            insert(TrainerAvailability),
+            [
+                {
+                    "trainer_id": trainer_id,
+                    "start_time": day + timedelta(hours=6),
+                    "end_time": day + timedelta(hours=22),
+                }
+                for trainer_id in trainer_ids
+                for day in days
+            ],
+        )
+
+        # the class everyone tries to book the moment it opens
+        rush = db.session.execute(
+            insert(ClassSession)
+            .values(
+                title="Opening night spin",
+                trainer_id=trainer_ids[0],
+                room_id=room_ids[0],
+                start_time=days[0] + timedelta(hours=5),
+                end_time=days[0] + timedelta(hours=6),
+                capacity=capacity,
+            )
+            .returning(ClassSession.id)
+        ).scalar_one()
+        # background schedule so portal pages have something to list
+        db.session.execute(
+            insert(ClassSession),
+            [
+                {
+                    "title": f"Class {i}",
+                    "trainer_id": trainer_ids[i % len(trainer_ids)],
+                    "room_id": room_ids[i % len(room_ids)],
+                    "start_time": days[i % 7] + timedelta(hours=22, minutes=i),
+                    "end_time": days[i % 7] + timedelta(hours=22, minutes=i + 1),
+                    "capacity": 20,
+                }
+                for i in range(50)
+            ],
+        )
+        last_pt_id = db.session.scalar(select(func.max(PTSession.id))) or 0
+        db.session.commit()
+
+    return {
+        "member_ids": member_ids,
+        "trainer_ids": trainer_ids,
+        "room_ids": room_ids,
+        "days": days,
+        "rush_class_id": rush,
+        "last_pt_id": last_pt_id,
+    }
+
+
+def check_integrity(app, ids, capacity):
+    """
+    Count broken invariants left behind by the run.
+    """
+    from sqlalchemy import and_, func, or_, select
+    from sqlalchemy.orm import aliased
+
+    from models import db
+    from models.schema import ClassRegistration, PTSession
+
+    with app.app_context():
+        registered = db.session.scalar(
+            select(func.count(ClassRegistration.id)).where(
+                ClassRegistration.class_session_id == ids["rush_class_id"]
+            )
+        )
+        other = aliased(PTSession)
+        new_pt = PTSession.id > ids["last_pt_id"]
+        double_booked = db.session.scalar(
+            select(func.count())
+            .select_from(PTSession)
+            .join(
+                other,
+                and_(
+                    other.id < PTSession.id,
+                    other.start_time < PTSession.end_time,
+                    other.end_time > PTSession.start_time,
+                    or_(other.room_id == PTSession.room_id, other.trainer_id == PTSession.trainer_id),
+                ),
+            )
+            .where(new_pt)
+        )
+        booked = db.session.scalar(select(func.count(PTSession.id)).where(new_pt))
+
+    return {
+        "rush_registered": registered,
+        "rush_capacity": capacity,
+        "overbooked_seats": max(0, registered - capacity),
+        "pt_booked": booked,
+        "pt_double_booked": double_booked,
+    }
+
+
+# ---------- workload ----------
+
+def _dashboard(rng, ids):
+    return "GET", f"/member?member_id={rng.choice(ids['member_ids'])}", None
+
+
+def _class_rush(rng, ids):
+    return "POST", "/member/class-register", {
+        "member_id": rng.choice(ids["member_ids"]),
+        "class_session_id": ids["rush_class_id"],
+    }
+
+
+def _metric(rng, ids):
+    return "POST", "/member/metric", {
+        "member_id": rng.choice(ids["member_ids"]),
+        "height_cm": rng.randint(150, 200),
+        "weight_kg": round(rng.uniform(50, 110), 1),
+        "heart_rate_bpm": rng.randint(50, 180),
+    }
+
+
+def _pt_booking(rng, ids):
+    start = rng.choice(ids["days"]) + timedelta(hours=rng.randint(6, 20), minutes=rng.choice((0, 30)))
+    return "POST", "/admin/ptsession", {
+        "member_id": rng.choice(ids["member_ids"]),
+        "trainer_id": rng.choice(ids["trainer_ids"]),
+        "room_id": rng.choice(ids["room_ids"]),
+        "start_time": start.strftime("%Y-%m-%dT%H:%M"),
+        "end_time": (start + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M"),
+    }
+
+
+def _admin(rng, ids):
+    return "GET", "/admin", None
+
+
+def _trainer(rng, ids):
+    return "GET", f"/trainer?trainer_id={rng.choice(ids['trainer_ids'])}", None
+
+
+OPERATIONS = {
+    "dashboard": _dashboard,
+    "class_rush": _class_rush,
+    "metric": _metric,
+    "pt_booking": _pt_booking,
+    "admin": _admin,
+    "trainer": _trainer,
+}
+
+
+def send(base_url, method, path, form=None, timeout=60):
+    data = urllib.parse.urlencode(form).encode() if form is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method)
+    try:
+        with _opener.open(req, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def statement_total(base_url):
+    """
+    Sum of db_statements_total from /metrics, or None when it is unavailable.
+    """
+    try:
+        with urllib.request.urlopen(base_url + "/metrics", timeout=10) as response:
+            text = response.read().decode()
+    except (urllib.error.URLError, OSError):
+        return None
+    values = re.findall(r"^db_statements_total(?:\{[^}]*\})? (\S+)$", text, re.MULTILINE)
+    return sum(float(v) for v in values) if values else None
+
+
+def run_clients(base_url, ids, mix, concurrency, duration, seed_value):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    deadline = time.perf_counter() + duration
+    results = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+
+    def client(index):
+        rng = random.Random(seed_value * 1000 + index)
+        latencies = {name: [] for name in names}
+        failed = {name: 0 for name in names}
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            method, path, form = OPERATIONS[name](rng, ids)
+            start = time.perf_counter()
+            try:
+                status = send(base_url, method, path, form)
+            except (urllib.error.URLError, OSError):
+                status = None
+            latencies[name].append(time.perf_counter() - start)
+            if status is None or status >= 400:
+                failed[name] += 1
+        with lock:
+            for name in names:
+                results[name].extend(latencies[name])
+                errors[name] += failed[name]
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors, time.perf_counter() - started
+
+
+def print_report(results, errors, elapsed, statements, integrity):
+    print(f"\n{'operation':<12} {'requests':>9} {'errors':>7} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    everything = []
+    for name, latencies in list(results.items()) + [("total", None)]:
+        if latencies is None:
+            latencies = everything
+            failed = sum(errors.values())
+        else:
+            everything.extend(latencies)
+            failed = errors[name]
+        latencies = sorted(latencies)
+        print(
+            f"{name:<12} {len(latencies):>9} {failed:>7} {len(latencies) / elapsed:>8.1f} "
+            f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.9) * 1000:>8.1f} "
+            f"{percentile(latencies, 0.99) * 1000:>8.1f} "
+            f"{(latencies[-1] if latencies else 0) * 1000:>8.1f}"
+        )
+
+    print(f"\nelapsed {elapsed:.1f}s")
+    if statements is not None:
+        per_request = statements / len(everything) if everything else 0
+        print(f"db statements {statements:.0f} ({per_request:.1f} per request)")
+    else:
+        print("db statements unavailable (/metrics disabled)")
+    print(
+        f"class rush: {integrity['rush_registered']} registered for "
+        f"{integrity['rush_capacity']} seats, {integrity['overbooked_seats']} overbooked"
+    )
+    print(
+        f"pt bookings: {integrity['pt_booked']} booked, "
+        f"{integrity['pt_double_booked']} overlapping a room or trainer"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the club app over HTTP.")
+    parser.add_argument("--database", help="SQLAlchemy URL; defaults to a temporary SQLite file")
+    parser.add_argument("--url", help="test a running server instead of starting one")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted operations, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--trainers", type=int, default=20)
+    parser.add_argument("--capacity", type=int, default=20, help="seats in the rush class")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.url and not args.database:
+        parser.error("--url needs --database pointing at the running server's database")
+    mix = parse_mix(args.mix)
+
+    tmpdir = None
+    if args.database:
+        os.environ["DATABASE_URL"] = args.database
+    else:
+        tmpdir = tempfile.mkdtemp(prefix="fitness-load-")
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmpdir, "load.db")
+    # config is read from the environment at import time
+    os.environ.setdefault("SLOW_QUERY_MS", "off")
+
+    from werkzeug.serving import make_server
+
+    # one access log line per request would drown the report
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    from app import create_app
+
+    server = None
+    try:
+        app = create_app()
+        tag = int(time.time())
+        ids = seed(app, args.members, args.trainers, args.capacity, tag)
+
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            server = make_server("127.0.0.1", 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_port}"
+
+        print(f"{os.environ['DATABASE_URL']} at {base_url}, {args.concurrency} clients for {args.duration:g}s")
+        before = statement_total(base_url)
+        results, errors, elapsed = run_clients(
+            base_url, ids, mix, args.concurrency, args.duration, args.seed
+        )
+        after = statement_total(base_url)
+        statements = after - before if before is not None and after is not None else None
+
+        print_report(results, errors, elapsed, statements, check_integrity(app, ids, args.capacity))
+    finally:
+        if server is not None:
+            server.shutdown()
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
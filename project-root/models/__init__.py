@@ -1,10 +1,79 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session, _app_ctx_id
+
+# club site the current operation is routed to; None means the default database
+current_site = ContextVar("current_site", default=None)
+
+# set for requests that write and inside use_writer(); databases with a
+# separate read pool (tuned SQLite) send everything else to the readers
+write_intent = ContextVar("write_intent", default=False)
+
+
+def site_bind_key(site):
+    return f"site_{site}"
+
+
+def read_bind_key(bind_key):
+    return f"{bind_key or 'default'}_read"
+
+
+@contextmanager
+def use_writer():
+    """
+    Send every db.session statement inside the block to the write connection.
+    """
+    token = write_intent.set(True)
+    try:
+        yield
+    finally:
+        write_intent.reset(token)
 
-db = SQLAlchemy()
+
+class SiteSession(Session):
+    """
+    Session that sends every statement to the current site's database bind,
+    and to its read pool when there is one and nothing is being written.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            site = current_site.get()
+            key = site_bind_key(site) if site is not None else None
+            if not write_intent.get():
+                reader = self._db.engines.get(read_bind_key(key))
+                if reader is not None:
+                    return reader
+            if key is not None:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _session_scope():
+    # one session per app context and site, so switching sites never mixes
+    # objects from different databases in the same identity map
+    return (_app_ctx_id(), current_site.get())
+
+
+db = SQLAlchemy(session_options={"class_": SiteSession, "scopefunc": _session_scope})
 
 
 def init_db(app):
     """
     Initialize SQLAlchemy with the Flask app.
     """
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    for site, uri in (app.config.get("SITE_DATABASES") or {}).items():
+        binds.setdefault(site_bind_key(site), uri)
+    app.config["SQLALCHEMY_BINDS"] = binds
+
+    if app.config.get("SQLITE_TUNING", True):
+        from .sqlite import configure_sqlite_binds
+        configure_sqlite_binds(app)
+
+    from .postgres import configure_prepared_statements
+    configure_prepared_statements(app)
+
     db.init_app(app)
@@ -0,0 +1,90 @@
+"""
+Outbox of row changes for downstream sync.
+
+Mutating operations call record_change() before they commit, so a change
+event exists exactly when its change does. Consumers page through the log
+with get_changes(after=<last id seen>) instead of re-reading whole tables.
+On Postgres the log is read in commit order rather than id order, see
+models/postgres.py; the cursor is still the id of the last event seen.
+"""
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select
+
+from . import db
+from .postgres import CURRENT_XID, in_commit_order, is_postgres
+from .schema import ChangeEvent
+
+
+def row_data(obj):
+    # xid is commit-order bookkeeping, not part of the row's data
+    return {
+        column.key: getattr(obj, column.key)
+        for column in obj.__table__.columns
+        if column.key != "xid"
+    }
+
+
+def record_changes(entity, action, rows):
+    """
+    Add change events for (entity_id, data) pairs to the current transaction.
+    """
+    now = datetime.utcnow()
+    events = [
+        {
+            "entity": entity,
+            "entity_id": entity_id,
+            "action": action,
+            "data": json.dumps(data, default=str) if data is not None else None,
+            "created_at": now,
+        }
+        for entity_id, data in rows
+    ]
+    if not events:
+        return
+    statement = insert(ChangeEvent)
+    if is_postgres():
+        statement = statement.values(xid=CURRENT_XID)
+    db.session.execute(statement, events)
+
+
+def record_change(action, obj):
+    """
+    Add a change event with the current column values of an ORM object.
+    """
+    if obj.id is None:
+        db.session.flush()
+    record_changes(obj.__tablename__, action, [(obj.id, row_data(obj))])
+
+
+def get_changes(after=0, limit=100):
+    """
+    Change events committed after the event with id `after`, oldest first.
+    Returns (events, has_more).
+    """
+    after_xid = None
+    if after and is_postgres():
+        # None as well when the cursor's event has been pruned
+        after_xid = db.session.execute(
+            select(ChangeEvent.xid).where(ChangeEvent.id == after)
+        ).scalar()
+    rows = db.session.execute(
+        in_commit_order(select(ChangeEvent), ChangeEvent, after, after_xid).limit(limit + 1)
+    ).scalars().all()
+    return rows[:limit], len(rows) > limit
+
+
+def prune_changes(days):
+    """
+    Delete change events older than `days` days. Returns the number deleted.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    # always keep the newest event: a SQLite table created before
+    # AUTOINCREMENT was declared continues from the highest remaining id
+    newest = select(func.max(ChangeEvent.id)).scalar_subquery()
+    count = db.session.execute(
+        delete(ChangeEvent).where(ChangeEvent.created_at < cutoff, ChangeEvent.id < newest)
+    ).rowcount
+    db.session.commit()
+    return count
@@ -0,0 +1,198 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+from . import db, current_site
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "fitness_club_events"
+
+broker = None
+
+# caps concurrent /events streams in this process when EVENT_STREAM_LIMIT is set
+stream_slots = None
+
+
+class InMemoryBroker:
+    """
+    In-process pub/sub. Every subscriber gets its own bounded queue of
+    (event, json_payload) pairs; slow subscribers drop messages instead of
+    blocking publishers.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscription = queue.Queue(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event, payload):
+        self.deliver(event, payload)
+
+    def deliver(self, event, payload):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait((event, payload))
+            except queue.Full:
+                pass
+
+
+class PostgresBroker(InMemoryBroker):
+    """
+    Uses Postgres LISTEN/NOTIFY so events published by one worker process
+    reach subscribers in every worker. A listener thread, started on the
+    first subscription, forwards notifications to the local queues.
+    """
+
+    def __init__(self, engine, queue_size=100):
+        super().__init__(queue_size)
+        self.engine = engine
+        self._listener = None
+
+    def subscribe(self):
+        self._ensure_listener()
+        return super().subscribe()
+
+    def publish(self, event, payload):
+        message = json.dumps({"event": event, "payload": payload})
+        with self.engine.connect() as conn:
+            conn.execute(
+                text("SELECT pg_notify(:channel, :message)"),
+                {"channel": CHANNEL, "message": message},
+            )
+            conn.commit()
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(
+                    target=self._listen, name="event-listener", daemon=True
+                )
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                self._listen_once()
+            except Exception:
+                logger.exception("Event listener lost its connection, retrying.")
+                time.sleep(2)
+
+    def _listen_once(self):
+        raw = self.engine.raw_connection()
+        # keep the LISTEN connection out of the pool
+        raw.detach()
+        conn = raw.driver_connection
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            if callable(conn.notifies):
+                # psycopg 3 yields notifications instead of queueing them
+                while True:
+                    for notify in conn.notifies(timeout=5):
+                        self._forward(notify.payload)
+            while True:
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._forward(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+    def _forward(self, payload):
+        message = json.loads(payload)
+        self.deliver(message["event"], message["payload"])
+
+
+def init_events(app, processes=1):
+    """
+    Pick the event broker from config. EVENT_BROKER may be "memory",
+    "postgres" or unset, in which case Postgres databases use LISTEN/NOTIFY
+    and everything else stays in process. The memory broker only reaches
+    subscribers in its own process, so it is refused when the app runs in
+    several worker processes and live updates are turned off instead.
+    """
+    global broker, stream_slots
+
+    kind = app.config.get("EVENT_BROKER")
+    if kind is None:
+        kind = "postgres" if db.engine.dialect.name == "postgresql" else "memory"
+
+    if kind == "memory" and processes > 1:
+        logger.warning(
+            "Live updates are disabled: the memory event broker cannot reach other "
+            "worker processes. Use a Postgres database or run a single worker."
+        )
+        kind = None
+
+    if kind == "postgres":
+        broker = PostgresBroker(db.engine)
+    elif kind == "memory":
+        broker = InMemoryBroker()
+    else:
+        broker = None
+
+    limit = app.config.get("EVENT_STREAM_LIMIT")
+    stream_slots = threading.BoundedSemaphore(limit) if limit is not None else None
+
+
+def enabled():
+    return broker is not None
+
+
+def acquire_stream():
+    """
+    Reserve one of this process's /events stream slots. Returns False when
+    they are all taken.
+    """
+    return stream_slots is None or stream_slots.acquire(blocking=False)
+
+
+def release_stream():
+    if stream_slots is not None:
+        stream_slots.release()
+
+
+def publish(event, data):
+    """
+    Publish an event after the change has been committed. Payloads are
+    serialized once here so subscribers can forward them as-is.
+    """
+    if broker is None:
+        return
+    data = dict(data, site=current_site.get())
+    try:
+        broker.publish(event, json.dumps(data, default=str))
+    except Exception:
+        # live updates are best-effort and must never fail a write
+        logger.exception("Could not publish %s event.", event)
+
+
+def subscribe():
+    if broker is None:
+        return None
+    return broker.subscribe()
+
+
+def unsubscribe(subscription):
+    if broker is not None and subscription is not None:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,264 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from . import db, current_site, use_writer
+from .schema import Job
+from .sites import use_site
+
+# seconds before the first retry, doubled on every further attempt
+RETRY_DELAY = 30
+
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """
+    Register a function as the handler for a job type. Handlers are called
+    as handler(context, **payload) and may return a JSON-serializable result.
+    """
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+class JobContext:
+    """
+    Passed to handlers so they can report progress. Progress is written on a
+    separate connection so it never commits the handler's own unit of work.
+    """
+
+    def __init__(self, job_id, min_interval=1.0):
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self._last_update = 0.0
+
+    def progress(self, fraction, message=None):
+        now = time.monotonic()
+        if fraction < 1 and now - self._last_update < self.min_interval:
+            return
+        self._last_update = now
+        with db.engine.begin() as conn:
+            conn.execute(
+                update(Job)
+                .where(Job.id == self.job_id)
+                .values(progress=min(max(fraction, 0.0), 1.0), message=message)
+            )
+
+
+# ---------- queue operations ----------
+
+# The jobs table lives in the default database, which is the one worker.py
+# polls, whatever site the request is routed to. A job enqueued for another
+# site carries it in its payload and run_job() switches to it. Every write to
+# it goes through use_writer(), since a tuned SQLite database would otherwise
+# send it to a reader connection.
+
+def enqueue_job(kind, payload=None, max_attempts=3, run_after=None):
+    if kind not in HANDLERS:
+        raise ValueError("Unknown job type.")
+
+    payload = dict(payload or {})
+    if current_site.get() is not None:
+        payload.setdefault("site", current_site.get())
+
+    with use_site(None), use_writer():
+        job = Job(
+            kind=kind,
+            payload=json.dumps(payload),
+            status="Queued",
+            max_attempts=max_attempts,
+            run_after=run_after or datetime.utcnow(),
+            created_at=datetime.utcnow(),
+        )
+        db.session.add(job)
+        db.session.commit()
+        # load the committed row here; outside the block it would refresh from the site
+        db.session.refresh(job)
+    return job
+
+
+def claim_job(worker_id):
+    """
+    Atomically move the oldest runnable job to Running and return its id,
+    or None when the queue is empty.
+    """
+    with use_writer():
+        return _claim_job(worker_id)
+
+
+def _claim_job(worker_id):
+    now = datetime.utcnow()
+    claimed = {
+        "status": "Running",
+        "attempts": Job.attempts + 1,
+        "locked_by": worker_id,
+        "started_at": now,
+        "message": None,
+    }
+
+    if db.engine.dialect.name == "postgresql":
+        # concurrent workers skip rows another worker has already locked
+        job = (
+            Job.query.filter(Job.status == "Queued", Job.run_after <= now)
+            .order_by(Job.id)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if job is None:
+            db.session.rollback()
+            return None
+        db.session.execute(update(Job).where(Job.id == job.id).values(**claimed))
+        db.session.commit()
+        return job.id
+
+    # SQLite has no row locks, but it serializes writers, so a single
+    # conditional UPDATE of the oldest queued row acts as the claim lock.
+    next_id = (
+        select(Job.id)
+        .where(Job.status == "Queued", Job.run_after <= now)
+        .order_by(Job.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    job_id = db.session.execute(
+        update(Job)
+        .where(Job.id == next_id, Job.status == "Queued")
+        .values(**claimed)
+        .returning(Job.id)
+    ).scalar()
+    db.session.commit()
+    return job_id
+
+
+def fail_job(job_id, error):
+    """
+    Record a failed attempt, re-queueing with exponential backoff while
+    attempts remain.
+    """
+    with use_writer():
+        job = db.session.get(Job, job_id)
+        if job is None:
+            return None
+        if job.status != "Running":
+            # already settled, e.g. the child recorded it before the pool broke
+            return job.status
+
+        now = datetime.utcnow()
+        job.error = error
+        job.locked_by = None
+        if job.attempts < job.max_attempts:
+            job.status = "Queued"
+            job.run_after = now + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = "Failed"
+            job.finished_at = now
+        db.session.commit()
+        return job.status
+
+
+def run_job(job_id):
+    """
+    Execute a claimed job. Runs inside an app context in the worker process.
+    Handlers read from the read pool where there is one, which leaves the
+    single SQLite writer free for JobContext.progress(); handlers that write
+    enter use_writer() themselves.
+    """
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return None
+    if job.status != "Running":
+        # settled already, e.g. it finished just before its pool broke
+        return job.status
+
+    handler = HANDLERS.get(job.kind)
+    payload = json.loads(job.payload or "{}")
+    site = payload.pop("site", None)
+
+    try:
+        if handler is None:
+            raise ValueError(f"No handler for job type {job.kind}.")
+        # the job row stays in the default database; the work runs against its site
+        with use_site(site):
+            result = handler(JobContext(job_id), **payload)
+    except Exception as e:
+        db.session.rollback()
+        return fail_job(job_id, f"{type(e).__name__}: {e}")
+
+    with use_writer():
+        job = db.session.get(Job, job_id)
+        job.status = "Succeeded"
+        job.progress = 1.0
+        job.result = json.dumps(result, default=str) if result is not None else None
+        job.error = None
+        job.locked_by = None
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        return job.status
+
+
+def requeue_stale_jobs(timeout_seconds=3600):
+    """
+    Put Running jobs whose worker disappeared back on the queue.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout_seconds)
+    with use_writer():
+        count = db.session.execute(
+            update(Job)
+            .where(Job.status == "Running", Job.started_at < cutoff)
+            .values(status="Queued", locked_by=None, run_after=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+    return count
+
+
+def get_recent_jobs(limit=50):
+    with use_site(None):
+        return Job.query.order_by(Job.id.desc()).limit(limit).all()
+
+
+def get_job(job_id):
+    with use_site(None):
+        job = db.session.get(Job, job_id)
+    if not job:
+        raise ValueError("Job not found.")
+    return job
+
+
+# ---------- handlers ----------
+
+@job_handler("trainer_utilization")
+def trainer_utilization_job(context, start, end, period="week"):
+    from .reports import get_trainer_utilization_report
+
+    report = get_trainer_utilization_report(start, end, period, progress=context.progress)
+    return report["rows"]
+
+
+@job_handler("metric_store_sync")
+def metric_store_sync_job(context):
+    from .metric_store import sync_metric_store
+
+    return {"appended": sync_metric_store(progress=context.progress)}
+
+
+@job_handler("retention_refresh")
+def retention_refresh_job(context, full=False):
+    from .retention import refresh_retention
+
+    with use_writer():
+        return refresh_retention(full=bool(full))
+
+
+@job_handler("change_log_prune")
+def change_log_prune_job(context, days=None):
+    from .changes import prune_changes
+
+    if days is None:
+        days = current_app.config.get("CHANGE_LOG_RETENTION_DAYS", 30)
+    with use_writer():
+        return {"deleted": prune_changes(int(days))}
@@ -0,0 +1,289 @@
+"""
+Columnar on-disk copy of health_metrics for analytics.
+
+Each column is a flat binary file of fixed-width values (int64 member ids,
+float64 everything else, NaN for NULL, recorded_at as UTC epoch seconds)
+that readers memory-map as numpy arrays, so queries are vectorized scans
+that never go through the OLTP database or create a Python object per row.
+Health metrics are insert-only, so syncing appends rows committed after
+the last exported one (models/postgres.py in_commit_order), and a sync
+never passes over a lower id that is still uncommitted.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from . import db, current_site
+from .postgres import in_commit_order
+from .schema import HealthMetric
+
+COLUMNS = (
+    ("member_id", "q"),
+    ("recorded_at", "d"),
+    ("height_cm", "d"),
+    ("weight_kg", "d"),
+    ("heart_rate_bpm", "d"),
+)
+
+EPOCH = datetime(1970, 1, 1)
+
+def default_store_path():
+    path = current_app.config.get("METRIC_STORE_PATH") or os.path.join(
+        current_app.instance_path, "metric_store"
+    )
+    site = current_site.get()
+    return os.path.join(path, site) if site else path
+
+
+def to_epoch(dt):
+    return (dt - EPOCH).total_seconds()
+
+
+def from_epoch(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def _column_path(path, name):
+    return os.path.join(path, f"{name}.bin")
+
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"last_id": 0, "rows": 0}
+
+
+def _write_meta(path, meta):
+    tmp = os.path.join(path, "meta.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, "meta.json"))
+
+
+# ---------- export ----------
+
+def sync_metric_store(path=None, batch_size=50000, progress=None):
+    """
+    Append health metrics newer than the last exported id to the column
+    files. Returns the number of rows appended.
+    """
+    path = path or default_store_path()
+    os.makedirs(path, exist_ok=True)
+    meta = _read_meta(path)
+
+    # drop anything a crashed sync wrote after the last committed meta.json
+    for name, code in COLUMNS:
+        column_file = _column_path(path, name)
+        with open(column_file, "ab") as f:
+            f.truncate(meta["rows"] * np.dtype(code).itemsize)
+
+    def pending():
+        return in_commit_order(
+            select(
+                HealthMetric.xid,
+                HealthMetric.id,
+                HealthMetric.member_id,
+                HealthMetric.recorded_at,
+                HealthMetric.height_cm,
+                HealthMetric.weight_kg,
+                HealthMetric.heart_rate_bpm,
+            ),
+            HealthMetric,
+            meta["last_id"],
+            meta.get("last_xid"),
+        )
+
+    total = db.session.execute(select(func.count()).select_from(pending().subquery())).scalar()
+    appended = 0
+    while True:
+        rows = db.session.execute(pending().limit(batch_size)).all()
+        if not rows:
+            break
+
+        xids, ids, member_ids, recorded_at, *measures = zip(*rows)
+        # NULL timestamps become NaT and NULL measures None, both NaN as floats
+        recorded = np.array(recorded_at, dtype="datetime64[us]")
+        columns = {
+            "member_id": np.array(member_ids, dtype=np.int64),
+            "recorded_at": (recorded - np.datetime64(EPOCH, "us")) / np.timedelta64(1, "s"),
+        }
+        for (name, _), values in zip(COLUMNS[2:], measures):
+            columns[name] = np.array(values, dtype=np.float64)
+
+        for name, code in COLUMNS:
+            with open(_column_path(path, name), "ab") as f:
+                columns[name].astype(code, copy=False).tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+
+        meta["last_id"] = ids[-1]
+        meta["last_xid"] = xids[-1]
+        meta["rows"] += len(rows)
+        _write_meta(path, meta)
+        appended += len(rows)
+        if progress and total:
+            progress(appended / total, f"{appended} of {total} rows")
+
+    return appended
+
+
+# ---------- analytics ----------
+
+AGGREGATES = ("count", "sum", "mean", "min", "max", "last")
+
+
+def _group_index(keys):
+    """
+    (key of each group, group of each row). Non-negative integer keys such
+    as member ids are their own group numbers, which saves sorting them.
+    """
+    if keys.dtype.kind in "iu" and keys.min() >= 0:
+        return np.arange(keys.max() + 1), keys
+    return np.unique(keys, return_inverse=True)
+
+
+class MetricStore:
+    """
+    Read-only, memory-mapped view of the exported columns:
+
+        with MetricStore.open() as store:
+            store.group_by("weight_kg", "mean")
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = _read_meta(path)["rows"]
+        self.columns = {}
+        for name, code in COLUMNS:
+            self.columns[name] = self._map_column(name, code)
+
+    @classmethod
+    def open(cls, path=None):
+        return cls(path or default_store_path())
+
+    def _map_column(self, name, code):
+        if self.rows == 0:
+            return np.empty(0, dtype=code)
+        return np.memmap(_column_path(self.path, name), dtype=code, mode="r", shape=(self.rows,))
+
+    def close(self):
+        # a memmap unmaps once nothing references it any more
+        self.columns = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.rows
+
+    def mask(self, member_ids=None, since=None, until=None):
+        """
+        Boolean array of the rows matching the filters. since/until are
+        datetimes and the range is [since, until).
+        """
+        times = self.columns["recorded_at"]
+        matched = np.ones(self.rows, dtype=bool)
+        if since:
+            matched &= times >= to_epoch(since)
+        if until:
+            matched &= times < to_epoch(until)
+        if member_ids is not None:
+            matched &= np.isin(self.columns["member_id"], np.fromiter(member_ids, dtype=np.int64))
+        return matched
+
+    def select(self, member_ids=None, since=None, until=None):
+        """
+        Indexes of the rows matching the filters, as an int array.
+        """
+        return np.flatnonzero(self.mask(member_ids, since, until))
+
+    def group_by(self, column, agg="mean", key="member_id", rows=None):
+        """
+        Aggregate `column` per value of `key` (member_id by default), skipping
+        rows where either is NULL. agg is one of count, sum, mean, min, max or last (latest by
+        recorded_at). `rows` restricts the scan to a mask or the indexes
+        from select(). Returns {key: value}.
+        """
+        if agg not in AGGREGATES:
+            raise ValueError("Unknown aggregate.")
+
+        keys = self.columns[key]
+        values = self.columns[column]
+        times = self.columns["recorded_at"]
+        if rows is not None:
+            keys, values, times = keys[rows], values[rows], times[rows]
+
+        if len(keys) == 0:
+            return {}
+
+        # NULL rows stay in place and are weighted out, which saves copying
+        # every column down to the valid rows first
+        valid = ~np.isnan(values)
+        if agg == "last":
+            valid &= ~np.isnan(times)
+        if keys.dtype.kind == "f":
+            # rows without a key belong to no group
+            valid &= ~np.isnan(keys)
+            keys = np.where(valid, keys, 0.0)
+        unique, group = _group_index(keys)
+        size = len(unique)
+        counts = np.bincount(group, weights=valid, minlength=size).astype(np.int64)
+        present = counts > 0
+
+        if agg == "count":
+            result = counts
+        elif agg in ("sum", "mean"):
+            result = np.bincount(group, weights=np.where(valid, values, 0.0), minlength=size)
+            if agg == "mean":
+                result = result / np.where(present, counts, 1)
+        elif agg == "min":
+            # fmin/fmax skip NaN
+            result = np.full(size, np.inf)
+            np.fmin.at(result, group, values)
+        elif agg == "max":
+            result = np.full(size, -np.inf)
+            np.fmax.at(result, group, values)
+        else:
+            # the row with the latest time per group, the last such row on ties
+            times = np.where(valid, times, -np.inf)
+            latest = np.full(size, -np.inf)
+            np.maximum.at(latest, group, times)
+            newest = np.flatnonzero(valid & (times == latest[group]))
+            chosen = np.zeros(size, dtype=np.int64)
+            np.maximum.at(chosen, group[newest], newest)
+            result = values[chosen]
+
+        return dict(zip(unique[present].tolist(), result[present].tolist()))
+
+    def cohort_series(self, column, member_ids=None, since=None, until=None, bucket_days=7):
+        """
+        Mean of `column` per time bucket for a cohort of members:
+        [(bucket_start, count, mean), ...] in time order.
+        """
+        matched = self.mask(member_ids, since, until)
+        values = self.columns[column][matched]
+        times = self.columns["recorded_at"][matched]
+        valid = ~np.isnan(values) & ~np.isnan(times)
+        width = bucket_days * 86400.0
+
+        buckets = np.floor(times[valid] / width)
+        unique, inverse = np.unique(buckets, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(unique))
+        totals = np.bincount(inverse, weights=values[valid], minlength=len(unique))
+
+        return [
+            (from_epoch(b * width), count, total / count)
+            for b, count, total in zip(unique.tolist(), counts.tolist(), totals.tolist())
+        ]
@@ -1,6 +1,37 @@
+from bisect import bisect_left, insort
 from datetime import datetime
 
-from . import db
+from sqlalchemy import (
+    Boolean,
+    bindparam,
+    case,
+    exists,
+    func,
+    insert,
+    literal,
+    not_,
+    or_,
+    select,
+    true,
+    union_all,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, joinedload
+
+from . import db, events
+from .changes import record_change, record_changes, row_data
+from .postgres import CURRENT_XID, is_postgres
+from .projections import (
+    MemberRow,
+    MemberSearchRow,
+    TrainerRow,
+    RoomRow,
+    ClassRow,
+    PTRow,
+    InvoiceRow,
+    fetch,
+)
 from .schema import (
     Member,
     Trainer,
@@ -37,6 +68,31 @@ def parse_datetime_local(dt_str):
         return None
 
 
+def _overlap_exists(model, column, value, start, end, exclude_id=None):
+    """
+    EXISTS clause for a row of `model` with column == value overlapping [start, end).
+    """
+    # overlapping if not (existing.end <= start or existing.start >= end)
+    criteria = [column == value, model.start_time < end, model.end_time > start]
+    if exclude_id is not None:
+        criteria.append(model.id != exclude_id)
+    return exists().where(*criteria)
+
+
+def room_conflict_clause(room_id, start, end, exclude_class_id=None, exclude_pt_id=None):
+    return or_(
+        _overlap_exists(ClassSession, ClassSession.room_id, room_id, start, end, exclude_class_id),
+        _overlap_exists(PTSession, PTSession.room_id, room_id, start, end, exclude_pt_id),
+    )
+
+
+def trainer_conflict_clause(trainer_id, start, end, exclude_class_id=None, exclude_pt_id=None):
+    return or_(
+        _overlap_exists(ClassSession, ClassSession.trainer_id, trainer_id, start, end, exclude_class_id),
+        _overlap_exists(PTSession, PTSession.trainer_id, trainer_id, start, end, exclude_pt_id),
+    )
+
+
 def check_room_conflict(room_id, start, end, exclude_class_id=None, exclude_pt_id=None):
     """
     Return True if there is any class or PT session in this room overlapping [start, end).
@@ -44,47 +100,400 @@ def check_room_conflict(room_id, start, end, exclude_class_id=None, exclude_pt_i
     if not room_id or not start or not end:
         return False
 
-    # overlapping if not (existing.end <= start or existing.start >= end)
-    class_q = ClassSession.query.filter(ClassSession.room_id == room_id)
-    if exclude_class_id is not None:
-        class_q = class_q.filter(ClassSession.id != exclude_class_id)
-    class_q = class_q.filter(
-        ClassSession.start_time < end,
-        ClassSession.end_time > start,
-    )
-
-    pt_q = PTSession.query.filter(PTSession.room_id == room_id)
-    if exclude_pt_id is not None:
-        pt_q = pt_q.filter(PTSession.id != exclude_pt_id)
-    pt_q = pt_q.filter(
-        PTSession.start_time < end,
-        PTSession.end_time > start,
+    return bool(
+        db.session.execute(
+            ROOM_CONFLICT, _conflict_params(room_id, start, end, exclude_class_id, exclude_pt_id)
+        ).scalar()
     )
 
-    return class_q.first() is not None or pt_q.first() is not None
-
 
 def check_trainer_conflict(trainer_id, start, end, exclude_class_id=None, exclude_pt_id=None):
     if not trainer_id or not start or not end:
         return False
 
-    class_q = ClassSession.query.filter(ClassSession.trainer_id == trainer_id)
-    if exclude_class_id is not None:
-        class_q = class_q.filter(ClassSession.id != exclude_class_id)
-    class_q = class_q.filter(
-        ClassSession.start_time < end,
-        ClassSession.end_time > start,
+    return bool(
+        db.session.execute(
+            TRAINER_CONFLICT,
+            _conflict_params(trainer_id, start, end, exclude_class_id, exclude_pt_id),
+        ).scalar()
+    )
+
+
+# ---------- combined validation ----------
+
+VALIDATION_MESSAGES = {
+    "member_not_found": "Member not found.",
+    "trainer_not_found": "Trainer not found.",
+    "room_not_found": "Room not found.",
+    "class_not_found": "Class session not found.",
+    "pt_not_found": "PT session not found.",
+    "invalid_range": "Invalid time range.",
+    "trainer_unavailable": "Trainer is not available during this time.",
+    "room_conflict": "Room is already booked at that time.",
+    "trainer_conflict": "Trainer is already booked at that time.",
+    "already_registered": "Already registered for this class.",
+    "class_full": "Class is already full.",
+}
+
+
+def _row_exists(model, row_id):
+    return exists().where(model.id == row_id)
+
+
+def validation_query(checks):
+    """
+    Build one SELECT that evaluates every (condition, reason) pair and returns
+    the reason code of the first condition that does not hold, or NULL.
+    """
+    return select(case(*[(not_(cond), reason) for cond, reason in checks], else_=None))
+
+
+def raise_for_reason(reason):
+    if reason:
+        raise ValueError(VALIDATION_MESSAGES[reason])
+
+
+# ---------- live updates ----------
+
+def get_class_seat_counts(class_ids):
+    """
+    Return {class_session_id: registered count} for the given classes in one query.
+    """
+    if not class_ids:
+        return {}
+    return dict(db.session.execute(SEAT_COUNTS, {"class_ids": list(class_ids)}).all())
+
+
+# The *_event helpers return (event, payload), or None with live updates
+# off. Build them before commit: reading afterwards, even an expired
+# attribute, would begin a second transaction on the write connection and
+# hold it until the request ends.
+
+def class_seats_event(class_session_id):
+    if not events.enabled():
+        return None
+    registered, capacity = db.session.execute(
+        CLASS_SEATS, {"class_session_id": class_session_id}
+    ).one()
+    return (
+        "class_seats",
+        {
+            "class_session_id": class_session_id,
+            "registered": registered,
+            "capacity": capacity,
+        },
+    )
+
+
+def class_session_event(class_session):
+    if not events.enabled():
+        return None
+    return (
+        "class_session",
+        {
+            "id": class_session.id,
+            "title": class_session.title,
+            "trainer_id": class_session.trainer_id,
+            "room_id": class_session.room_id,
+            "room_name": class_session.room.name if class_session.room else None,
+            "start_time": class_session.start_time,
+            "end_time": class_session.end_time,
+            "capacity": class_session.capacity,
+        },
     )
 
-    pt_q = PTSession.query.filter(PTSession.trainer_id == trainer_id)
-    if exclude_pt_id is not None:
-        pt_q = pt_q.filter(PTSession.id != exclude_pt_id)
-    pt_q = pt_q.filter(
-        PTSession.start_time < end,
-        PTSession.end_time > start,
+
+def pt_session_event(pt_session):
+    if not events.enabled():
+        return None
+    return (
+        "pt_session",
+        {
+            "id": pt_session.id,
+            "member_id": pt_session.member_id,
+            "trainer_id": pt_session.trainer_id,
+            "room_id": pt_session.room_id,
+            "start_time": pt_session.start_time,
+            "end_time": pt_session.end_time,
+        },
     )
 
-    return class_q.first() is not None or pt_q.first() is not None
+
+def publish_events(*updates):
+    """
+    Publish events built before the commit that made them true.
+    """
+    for pending in updates:
+        if pending is not None:
+            events.publish(*pending)
+
+
+# ---------- listing projections ----------
+
+def class_rows_query():
+    return (
+        select(
+            ClassSession.id,
+            ClassSession.title,
+            ClassSession.trainer_id,
+            Trainer.name,
+            ClassSession.room_id,
+            Room.name,
+            ClassSession.start_time,
+            ClassSession.end_time,
+            ClassSession.capacity,
+        )
+        .outerjoin(Trainer, Trainer.id == ClassSession.trainer_id)
+        .outerjoin(Room, Room.id == ClassSession.room_id)
+        .order_by(ClassSession.start_time)
+    )
+
+
+def pt_rows_query():
+    return (
+        select(
+            PTSession.id,
+            PTSession.member_id,
+            Member.name,
+            PTSession.trainer_id,
+            Trainer.name,
+            PTSession.room_id,
+            Room.name,
+            PTSession.start_time,
+            PTSession.end_time,
+            PTSession.status,
+        )
+        .outerjoin(Member, Member.id == PTSession.member_id)
+        .outerjoin(Trainer, Trainer.id == PTSession.trainer_id)
+        .outerjoin(Room, Room.id == PTSession.room_id)
+        .order_by(PTSession.start_time)
+    )
+
+
+def get_all_rooms():
+    return fetch(RoomRow, ALL_ROOMS)
+
+
+# ---------- cached statements ----------
+# The hot queries are built once at import with bind parameters in place of
+# values. A statement object memoizes its cache key, so executing one skips
+# rebuilding the expression tree and the compiled-cache lookup stays cheap;
+# the SQL string is identical on every call, which also lets a driver with
+# server-side prepared statements reuse its plan (see PG_PREPARE_THRESHOLD).
+# Ids start at 1, so an exclusion id of 0 excludes nothing.
+
+def _conflict_params(row_id, start, end, exclude_class_id=None, exclude_pt_id=None):
+    return {
+        "row_id": row_id,
+        "start": start,
+        "end": end,
+        "exclude_class_id": exclude_class_id or 0,
+        "exclude_pt_id": exclude_pt_id or 0,
+    }
+
+
+def _range_params(start, end):
+    return {"start": start, "end": end, "valid_range": bool(start and end and start < end)}
+
+
+def _conflict_clause(build):
+    return build(
+        bindparam("row_id"),
+        bindparam("start"),
+        bindparam("end"),
+        bindparam("exclude_class_id"),
+        bindparam("exclude_pt_id"),
+    )
+
+
+ROOM_CONFLICT = select(_conflict_clause(room_conflict_clause))
+TRAINER_CONFLICT = select(_conflict_clause(trainer_conflict_clause))
+
+# an invalid range is reported before the conflict checks, which are false
+# anyway when start or end is NULL
+VALID_RANGE = bindparam("valid_range", type_=Boolean)
+
+_NEW_SESSION_CONFLICTS = [
+    (
+        not_(room_conflict_clause(bindparam("room_id"), bindparam("start"), bindparam("end"))),
+        "room_conflict",
+    ),
+    (
+        not_(trainer_conflict_clause(bindparam("trainer_id"), bindparam("start"), bindparam("end"))),
+        "trainer_conflict",
+    ),
+]
+
+CLASS_SESSION_CHECK = validation_query(
+    [
+        (_row_exists(Trainer, bindparam("trainer_id")), "trainer_not_found"),
+        (_row_exists(Room, bindparam("room_id")), "room_not_found"),
+        (VALID_RANGE, "invalid_range"),
+        *_NEW_SESSION_CONFLICTS,
+    ]
+)
+
+PT_SESSION_CHECK = validation_query(
+    [
+        (_row_exists(Member, bindparam("member_id")), "member_not_found"),
+        (_row_exists(Trainer, bindparam("trainer_id")), "trainer_not_found"),
+        (_row_exists(Room, bindparam("room_id")), "room_not_found"),
+        (VALID_RANGE, "invalid_range"),
+        # must be inside at least one availability slot
+        (
+            exists().where(
+                TrainerAvailability.trainer_id == bindparam("trainer_id"),
+                TrainerAvailability.start_time <= bindparam("start"),
+                TrainerAvailability.end_time >= bindparam("end"),
+            ),
+            "trainer_unavailable",
+        ),
+        *_NEW_SESSION_CONFLICTS,
+    ]
+)
+
+REGISTRATION_CHECK = validation_query(
+    [
+        (_row_exists(Member, bindparam("member_id")), "member_not_found"),
+        (_row_exists(ClassSession, bindparam("class_session_id")), "class_not_found"),
+        (
+            not_(
+                exists().where(
+                    ClassRegistration.member_id == bindparam("member_id"),
+                    ClassRegistration.class_session_id == bindparam("class_session_id"),
+                )
+            ),
+            "already_registered",
+        ),
+        (
+            select(func.count(ClassRegistration.id))
+            .where(ClassRegistration.class_session_id == bindparam("class_session_id"))
+            .scalar_subquery()
+            < select(ClassSession.capacity)
+            .where(ClassSession.id == bindparam("class_session_id"))
+            .scalar_subquery(),
+            "class_full",
+        ),
+    ]
+)
+
+
+def _room_move_check(model, exclude):
+    target = aliased(model)
+    return validation_query(
+        [
+            (_row_exists(Room, bindparam("room_id")), "room_not_found"),
+            (
+                not_(
+                    room_conflict_clause(
+                        bindparam("room_id"),
+                        target.start_time,
+                        target.end_time,
+                        **{exclude: target.id},
+                    )
+                ),
+                "room_conflict",
+            ),
+        ]
+    ).where(target.id == bindparam("session_id"))
+
+
+CLASS_ROOM_CHECK = _room_move_check(ClassSession, "exclude_class_id")
+PT_ROOM_CHECK = _room_move_check(PTSession, "exclude_pt_id")
+
+CLOSURE_CHECK = validation_query(
+    [
+        (_row_exists(Room, bindparam("room_id")), "room_not_found"),
+        (VALID_RANGE, "invalid_range"),
+    ]
+)
+
+SEAT_COUNTS = (
+    select(ClassRegistration.class_session_id, func.count(ClassRegistration.id))
+    .where(ClassRegistration.class_session_id.in_(bindparam("class_ids", expanding=True)))
+    .group_by(ClassRegistration.class_session_id)
+)
+
+CLASS_SEATS = select(
+    select(func.count(ClassRegistration.id))
+    .where(ClassRegistration.class_session_id == bindparam("class_session_id"))
+    .scalar_subquery(),
+    ClassSession.capacity,
+).where(ClassSession.id == bindparam("class_session_id"))
+
+LATEST_METRIC = (
+    select(HealthMetric)
+    .where(HealthMetric.member_id == bindparam("member_id"))
+    .order_by(HealthMetric.recorded_at.desc())
+    .limit(1)
+)
+
+ACTIVE_GOAL = (
+    select(FitnessGoal)
+    .where(FitnessGoal.member_id == bindparam("member_id"), FitnessGoal.is_active == true())
+    .order_by(FitnessGoal.created_at.desc())
+    .limit(1)
+)
+
+PAST_CLASS_COUNT = (
+    select(func.count(ClassRegistration.id))
+    .join(ClassSession, ClassRegistration.class_session_id == ClassSession.id)
+    .where(
+        ClassRegistration.member_id == bindparam("member_id"),
+        ClassSession.start_time < bindparam("now"),
+    )
+)
+
+MEMBER_UPCOMING_PT = pt_rows_query().where(
+    PTSession.member_id == bindparam("member_id"), PTSession.start_time >= bindparam("now")
+)
+TRAINER_UPCOMING_CLASSES = class_rows_query().where(
+    ClassSession.trainer_id == bindparam("trainer_id"), ClassSession.start_time >= bindparam("now")
+)
+TRAINER_UPCOMING_PT = pt_rows_query().where(
+    PTSession.trainer_id == bindparam("trainer_id"), PTSession.start_time >= bindparam("now")
+)
+UPCOMING_CLASSES = class_rows_query().where(ClassSession.start_time >= bindparam("now"))
+
+ALL_MEMBERS = select(Member.id, Member.name, Member.email).order_by(Member.name)
+ALL_TRAINERS = select(Trainer.id, Trainer.name, Trainer.email).order_by(Trainer.name)
+ALL_ROOMS = select(Room.id, Room.name, Room.capacity).order_by(Room.id)
+
+# each member's latest metric and newest active goal are joined in by id,
+# so a search is one statement however many members match
+_SEARCH_METRIC_ID = (
+    select(HealthMetric.id)
+    .where(HealthMetric.member_id == Member.id)
+    .order_by(HealthMetric.recorded_at.desc())
+    .limit(1)
+    .correlate(Member)
+    .scalar_subquery()
+)
+_SEARCH_GOAL_ID = (
+    select(FitnessGoal.id)
+    .where(FitnessGoal.member_id == Member.id, FitnessGoal.is_active == true())
+    .order_by(FitnessGoal.created_at.desc())
+    .limit(1)
+    .correlate(Member)
+    .scalar_subquery()
+)
+MEMBER_SEARCH = (
+    select(
+        Member.id,
+        Member.name,
+        Member.email,
+        FitnessGoal.id,
+        FitnessGoal.description,
+        FitnessGoal.target_weight_kg,
+        HealthMetric.id,
+        HealthMetric.weight_kg,
+        HealthMetric.heart_rate_bpm,
+    )
+    .outerjoin(FitnessGoal, FitnessGoal.id == _SEARCH_GOAL_ID)
+    .outerjoin(HealthMetric, HealthMetric.id == _SEARCH_METRIC_ID)
+    .where(Member.name.ilike(bindparam("pattern")))
+    .order_by(Member.name)
+)
 
 
 # ---------- seeding ----------
@@ -104,6 +513,8 @@ def ensure_default_rooms():
                 )
             )
         db.session.add_all(rooms)
+        db.session.flush()
+        record_changes("rooms", "created", [(room.id, row_data(room)) for room in rooms])
         db.session.commit()
 
 
@@ -127,6 +538,7 @@ def register_member(name, email, dob_str, gender, phone):
         phone=phone,
     )
     db.session.add(member)
+    record_change("created", member)
     db.session.commit()
     return member
 
@@ -142,11 +554,19 @@ def update_member_profile(member_id, name, gender, phone, goal_description, targ
         member.gender = gender
     if phone:
         member.phone = phone
+    if name or gender or phone:
+        record_change("updated", member)
 
     if goal_description:
         # mark existing goals inactive
-        FitnessGoal.query.filter_by(member_id=member_id, is_active=True).update(
-            {"is_active": False}
+        deactivated = db.session.execute(
+            update(FitnessGoal)
+            .where(FitnessGoal.member_id == member_id, FitnessGoal.is_active == true())
+            .values(is_active=False)
+            .returning(FitnessGoal)
+        ).scalars().all()
+        record_changes(
+            "fitness_goals", "updated", [(goal.id, row_data(goal)) for goal in deactivated]
         )
         goal = FitnessGoal(
             member_id=member_id,
@@ -156,6 +576,7 @@ def update_member_profile(member_id, name, gender, phone, goal_description, targ
             created_at=datetime.utcnow(),
         )
         db.session.add(goal)
+        record_change("created", goal)
 
     db.session.commit()
     return member
@@ -173,7 +594,11 @@ def add_health_metric(member_id, height_cm, weight_kg, heart_rate_bpm):
         heart_rate_bpm=int(heart_rate_bpm) if heart_rate_bpm else None,
         recorded_at=datetime.utcnow(),
     )
+    if is_postgres():
+        # read back in commit order by the metric store sync
+        metric.xid = CURRENT_XID
     db.session.add(metric)
+    record_change("created", metric)
     db.session.commit()
     return metric
 
@@ -183,35 +608,11 @@ def get_member_dashboard_data(member_id):
     if not member:
         raise ValueError("Member not found.")
 
-    latest_metric = (
-        HealthMetric.query.filter_by(member_id=member_id)
-        .order_by(HealthMetric.recorded_at.desc())
-        .first()
-    )
-    active_goal = (
-        FitnessGoal.query.filter_by(member_id=member_id, is_active=True)
-        .order_by(FitnessGoal.created_at.desc())
-        .first()
-    )
-
-    now = datetime.utcnow()
-
-    past_classes_count = (
-        db.session.query(ClassRegistration)
-        .join(ClassSession, ClassRegistration.class_session_id == ClassSession.id)
-        .filter(
-            ClassRegistration.member_id == member_id,
-            ClassSession.start_time < now,
-        )
-        .count()
-    )
-
-    upcoming_pt_sessions = (
-        PTSession.query.filter_by(member_id=member_id)
-        .filter(PTSession.start_time >= now)
-        .order_by(PTSession.start_time)
-        .all()
-    )
+    params = {"member_id": member_id, "now": datetime.utcnow()}
+    latest_metric = db.session.execute(LATEST_METRIC, params).scalar()
+    active_goal = db.session.execute(ACTIVE_GOAL, params).scalar()
+    past_classes_count = db.session.execute(PAST_CLASS_COUNT, params).scalar()
+    upcoming_pt_sessions = fetch(PTRow, MEMBER_UPCOMING_PT, params)
 
     return {
         "member": member,
@@ -223,47 +624,37 @@ def get_member_dashboard_data(member_id):
 
 
 def get_all_members():
-    return Member.query.order_by(Member.name).all()
+    return fetch(MemberRow, ALL_MEMBERS)
 
 
 def get_upcoming_classes():
-    now = datetime.utcnow()
-    return (
-        ClassSession.query
-        .filter(ClassSession.start_time >= now)
-        .order_by(ClassSession.start_time)
-        .all()
-    )
+    return fetch(ClassRow, UPCOMING_CLASSES, {"now": datetime.utcnow()})
 
 
 def register_member_for_class(member_id, class_session_id):
-    member = Member.query.get(member_id)
-    class_session = ClassSession.query.get(class_session_id)
+    reason = db.session.execute(
+        REGISTRATION_CHECK, {"member_id": member_id, "class_session_id": class_session_id}
+    ).scalar()
+    raise_for_reason(reason)
 
-    if not member:
-        raise ValueError("Member not found.")
-    if not class_session:
-        raise ValueError("Class session not found.")
-
-    existing = ClassRegistration.query.filter_by(
-        member_id=member_id,
-        class_session_id=class_session_id,
-    ).first()
-    if existing:
-        raise ValueError("Already registered for this class.")
-
-    current_count = ClassRegistration.query.filter_by(
-        class_session_id=class_session_id
-    ).count()
-    if current_count >= class_session.capacity:
-        raise ValueError("Class is already full.")
-
-    reg = ClassRegistration(
-        member_id=member_id,
-        class_session_id=class_session_id,
-    )
-    db.session.add(reg)
+    try:
+        reg = db.session.execute(
+            insert(ClassRegistration)
+            .values(
+                member_id=member_id,
+                class_session_id=class_session_id,
+                registered_at=datetime.utcnow(),
+            )
+            .returning(ClassRegistration)
+        ).scalar_one()
+    except IntegrityError:
+        # the SQLite capacity trigger caught a registration that raced past the check
+        db.session.rollback()
+        raise_for_reason("class_full")
+    record_change("created", reg)
+    seats = class_seats_event(class_session_id)
     db.session.commit()
+    publish_events(seats)
     return reg
 
 
@@ -293,6 +684,7 @@ def set_trainer_availability(trainer_id, start_str, end_str):
         end_time=end,
     )
     db.session.add(slot)
+    record_change("created", slot)
     db.session.commit()
     return slot
 
@@ -302,21 +694,9 @@ def get_trainer_schedule(trainer_id):
     if not trainer:
         raise ValueError("Trainer not found.")
 
-    now = datetime.utcnow()
-
-    classes = (
-        ClassSession.query.filter_by(trainer_id=trainer_id)
-        .filter(ClassSession.start_time >= now)
-        .order_by(ClassSession.start_time)
-        .all()
-    )
-
-    pt_sessions = (
-        PTSession.query.filter_by(trainer_id=trainer_id)
-        .filter(PTSession.start_time >= now)
-        .order_by(PTSession.start_time)
-        .all()
-    )
+    params = {"trainer_id": trainer_id, "now": datetime.utcnow()}
+    classes = fetch(ClassRow, TRAINER_UPCOMING_CLASSES, params)
+    pt_sessions = fetch(PTRow, TRAINER_UPCOMING_PT, params)
 
     availability = (
         TrainerAvailability.query.filter_by(trainer_id=trainer_id)
@@ -335,35 +715,11 @@ def get_trainer_schedule(trainer_id):
 def search_members_by_name(term):
     if not term:
         return []
-
-    members = Member.query.filter(
-        Member.name.ilike(f"%{term}%")
-    ).order_by(Member.name).all()
-
-    results = []
-    for m in members:
-        last_metric = (
-            HealthMetric.query.filter_by(member_id=m.id)
-            .order_by(HealthMetric.recorded_at.desc())
-            .first()
-        )
-        active_goal = (
-            FitnessGoal.query.filter_by(member_id=m.id, is_active=True)
-            .order_by(FitnessGoal.created_at.desc())
-            .first()
-        )
-        results.append(
-            {
-                "member": m,
-                "last_metric": last_metric,
-                "active_goal": active_goal,
-            }
-        )
-    return results
+    return fetch(MemberSearchRow, MEMBER_SEARCH, {"pattern": f"%{term}%"})
 
 
 def get_all_trainers():
-    return Trainer.query.order_by(Trainer.name).all()
+    return fetch(TrainerRow, ALL_TRAINERS)
 
 
 # ---------- admin operations ----------
@@ -378,81 +734,68 @@ def create_trainer(name, email):
 
     trainer = Trainer(name=name, email=email)
     db.session.add(trainer)
+    record_change("created", trainer)
     db.session.commit()
     return trainer
 
 
 def create_class_session(title, trainer_id, room_id, start_str, end_str, capacity):
-    trainer = Trainer.query.get(trainer_id)
-    room = Room.query.get(room_id)
-    if not trainer:
-        raise ValueError("Trainer not found.")
-    if not room:
-        raise ValueError("Room not found.")
-
     start = parse_datetime_local(start_str)
     end = parse_datetime_local(end_str)
-    if not start or not end or start >= end:
-        raise ValueError("Invalid time range.")
-
-    if check_room_conflict(room_id, start, end):
-        raise ValueError("Room is already booked at that time.")
-
-    if check_trainer_conflict(trainer_id, start, end):
-        raise ValueError("Trainer is already booked at that time.")
 
-    class_session = ClassSession(
-        title=title,
-        trainer_id=trainer_id,
-        room_id=room_id,
-        start_time=start,
-        end_time=end,
-        capacity=int(capacity) if capacity else 10,
-    )
-    db.session.add(class_session)
+    reason = db.session.execute(
+        CLASS_SESSION_CHECK,
+        {"trainer_id": trainer_id, "room_id": room_id, **_range_params(start, end)},
+    ).scalar()
+    raise_for_reason(reason)
+
+    class_session = db.session.execute(
+        insert(ClassSession)
+        .values(
+            title=title,
+            trainer_id=trainer_id,
+            room_id=room_id,
+            start_time=start,
+            end_time=end,
+            capacity=int(capacity) if capacity else 10,
+        )
+        .returning(ClassSession)
+    ).scalar_one()
+    record_change("created", class_session)
+    created = class_session_event(class_session)
     db.session.commit()
+    publish_events(created)
     return class_session
 
 
 def create_pt_session(member_id, trainer_id, room_id, start_str, end_str):
-    member = Member.query.get(member_id)
-    trainer = Trainer.query.get(trainer_id)
-    room = Room.query.get(room_id)
-
-    if not member:
-        raise ValueError("Member not found.")
-    if not trainer:
-        raise ValueError("Trainer not found.")
-    if not room:
-        raise ValueError("Room not found.")
-
     start = parse_datetime_local(start_str)
     end = parse_datetime_local(end_str)
-    if not start or not end or start >= end:
-        raise ValueError("Invalid time range.")
-
-    # must be inside at least one availability slot
-    availabilities = TrainerAvailability.query.filter_by(trainer_id=trainer.id).all()
-    fits_availability = any(
-        slot.start_time <= start and slot.end_time >= end for slot in availabilities
-    )
-    if not fits_availability:
-        raise ValueError("Trainer is not available during this time.")
-
-    if check_room_conflict(room_id, start, end):
-        raise ValueError("Room is already booked at that time.")
-    if check_trainer_conflict(trainer_id, start, end):
-        raise ValueError("Trainer is already booked at that time.")
 
-    pt = PTSession(
-        member_id=member_id,
-        trainer_id=trainer_id,
-        room_id=room_id,
-        start_time=start,
-        end_time=end,
-        status="Scheduled",
-    )
-    db.session.add(pt)
+    reason = db.session.execute(
+        PT_SESSION_CHECK,
+        {
+            "member_id": member_id,
+            "trainer_id": trainer_id,
+            "room_id": room_id,
+            **_range_params(start, end),
+        },
+    ).scalar()
+    raise_for_reason(reason)
+
+    pt = db.session.execute(
+        insert(PTSession)
+        .values(
+            member_id=member_id,
+            trainer_id=trainer_id,
+            room_id=room_id,
+            start_time=start,
+            end_time=end,
+            status="Scheduled",
+        )
+        .returning(PTSession)
+    ).scalar_one()
+    record_change("created", pt)
     db.session.commit()
     return pt
 
@@ -471,6 +814,7 @@ def create_invoice(member_id, description, amount, payment_method):
         created_at=datetime.utcnow(),
     )
     db.session.add(invoice)
+    record_change("created", invoice)
     db.session.commit()
     return invoice
 
@@ -482,57 +826,228 @@ def mark_invoice_paid(invoice_id):
 
     invoice.status = "Paid"
     invoice.paid_at = datetime.utcnow()
+    record_change("updated", invoice)
     db.session.commit()
     return invoice
 
 
 def update_class_session_room(class_session_id, new_room_id):
-    class_session = ClassSession.query.get(class_session_id)
-    if not class_session:
+    row = db.session.execute(
+        CLASS_ROOM_CHECK, {"room_id": new_room_id, "session_id": class_session_id}
+    ).first()
+    if row is None:
         raise ValueError("Class session not found.")
-
-    room = Room.query.get(new_room_id)
-    if not room:
-        raise ValueError("Room not found.")
-
-    start = class_session.start_time
-    end = class_session.end_time
-
-    if check_room_conflict(new_room_id, start, end, exclude_class_id=class_session.id):
-        raise ValueError("Room is already booked at that time.")
-
-    class_session.room_id = new_room_id
+    raise_for_reason(row[0])
+
+    class_session = db.session.execute(
+        update(ClassSession)
+        .where(ClassSession.id == class_session_id)
+        .values(room_id=new_room_id)
+        .returning(ClassSession)
+    ).scalar_one()
+    record_change("updated", class_session)
+    moved = class_session_event(class_session)
     db.session.commit()
+    publish_events(moved)
     return class_session
 
 
 def update_pt_session_room(pt_session_id, new_room_id):
-    pt_session = PTSession.query.get(pt_session_id)
-    if not pt_session:
+    row = db.session.execute(
+        PT_ROOM_CHECK, {"room_id": new_room_id, "session_id": pt_session_id}
+    ).first()
+    if row is None:
         raise ValueError("PT session not found.")
+    raise_for_reason(row[0])
+
+    pt_session = db.session.execute(
+        update(PTSession)
+        .where(PTSession.id == pt_session_id)
+        .values(room_id=new_room_id)
+        .returning(PTSession)
+    ).scalar_one()
+    record_change("updated", pt_session)
+    moved = pt_session_event(pt_session)
+    db.session.commit()
+    publish_events(moved)
+    return pt_session
 
-    room = Room.query.get(new_room_id)
-    if not room:
-        raise ValueError("Room not found.")
 
-    start = pt_session.start_time
-    end = pt_session.end_time
+def _room_bookings():
+    """
+    Class and PT sessions as one (kind, id, room_id, start_time, end_time, size)
+    subquery. A PT session needs room for one member.
+    """
+    return union_all(
+        select(
+            literal("class").label("kind"),
+            ClassSession.id,
+            ClassSession.room_id,
+            ClassSession.start_time,
+            ClassSession.end_time,
+            ClassSession.capacity.label("size"),
+        ),
+        select(
+            literal("pt").label("kind"),
+            PTSession.id,
+            PTSession.room_id,
+            PTSession.start_time,
+            PTSession.end_time,
+            literal(1).label("size"),
+        ),
+    ).subquery()
+
+
+def _is_free(busy, start, end):
+    """
+    busy is a start-sorted list of non-overlapping (start, end) bookings.
+    """
+    i = bisect_left(busy, (end,))
+    return i == 0 or busy[i - 1][1] <= start
 
-    if check_room_conflict(new_room_id, start, end, exclude_pt_id=pt_session.id):
-        raise ValueError("Room is already booked at that time.")
 
-    pt_session.room_id = new_room_id
+def plan_room_closure(room_id, start, end):
+    """
+    Work out new rooms for every session in room_id overlapping [start, end).
+
+    Loads the affected sessions and everything booked in other rooms during
+    their time span in one query, then places sessions in start order, each
+    into the smallest free room that fits its size (best fit keeps the large
+    rooms open for large classes). Returns (moves, unplaced) where moves is
+    a list of (kind, id, new_room_id) and unplaced lists the session rows
+    that no room could take.
+    """
+    bookings = _room_bookings()
+    closed = (
+        bookings.c.room_id == room_id,
+        bookings.c.start_time < end,
+        bookings.c.end_time > start,
+    )
+    span = select(
+        func.coalesce(func.min(bookings.c.start_time), start).label("first_start"),
+        func.coalesce(func.max(bookings.c.end_time), end).label("last_end"),
+    ).where(*closed).subquery()
+
+    rows = db.session.execute(
+        select(bookings)
+        .where(
+            bookings.c.start_time < span.c.last_end,
+            bookings.c.end_time > span.c.first_start,
+        )
+        .order_by(bookings.c.start_time, bookings.c.end_time)
+    ).all()
+    rooms = db.session.execute(
+        select(Room.id, Room.capacity).where(Room.id != room_id).order_by(Room.capacity, Room.id)
+    ).all()
+
+    busy = {rid: [] for rid, _ in rooms}
+    affected = []
+    for row in rows:
+        if row.room_id == room_id:
+            if row.start_time < end and row.end_time > start:
+                affected.append(row)
+        elif row.room_id in busy:
+            busy[row.room_id].append((row.start_time, row.end_time))
+    for intervals in busy.values():
+        intervals.sort()
+
+    moves = []
+    unplaced = []
+    for row in affected:
+        interval = (row.start_time, row.end_time)
+        for rid, capacity in rooms:
+            if capacity >= row.size and _is_free(busy[rid], *interval):
+                insort(busy[rid], interval)
+                moves.append((row.kind, row.id, rid))
+                break
+        else:
+            unplaced.append(row)
+    return moves, unplaced
+
+
+def reassign_room_closure(room_id, start_str, end_str):
+    """
+    Move every class and PT session out of a room closed during [start, end).
+    Either all sessions are moved in one transaction, or nothing changes and
+    the sessions that could not be placed are returned.
+    """
+    start = parse_datetime_local(start_str)
+    end = parse_datetime_local(end_str)
+
+    reason = db.session.execute(
+        CLOSURE_CHECK, {"room_id": room_id, **_range_params(start, end)}
+    ).scalar()
+    raise_for_reason(reason)
+
+    moves, unplaced = plan_room_closure(room_id, start, end)
+    if unplaced or not moves:
+        db.session.rollback()
+        return {"moved": 0, "unplaced": unplaced}
+
+    class_moves = [{"id": sid, "room_id": rid} for kind, sid, rid in moves if kind == "class"]
+    pt_moves = [{"id": sid, "room_id": rid} for kind, sid, rid in moves if kind == "pt"]
+    if class_moves:
+        db.session.execute(update(ClassSession), class_moves)
+    if pt_moves:
+        db.session.execute(update(PTSession), pt_moves)
+
+    # a booking made between planning and now would overlap a moved session
+    bookings = _room_bookings()
+    other = aliased(bookings)
+    clash = db.session.execute(
+        select(
+            exists().where(
+                bookings.c.room_id == other.c.room_id,
+                bookings.c.start_time < other.c.end_time,
+                bookings.c.end_time > other.c.start_time,
+                or_(bookings.c.kind != other.c.kind, bookings.c.id != other.c.id),
+                or_(
+                    (bookings.c.kind == "class") & bookings.c.id.in_([m["id"] for m in class_moves]),
+                    (bookings.c.kind == "pt") & bookings.c.id.in_([m["id"] for m in pt_moves]),
+                ),
+            )
+        )
+    ).scalar()
+    if clash:
+        db.session.rollback()
+        raise ValueError("Room bookings changed while reassigning. Please try again.")
+
+    moved_classes = (
+        ClassSession.query.options(joinedload(ClassSession.room))
+        .filter(ClassSession.id.in_([m["id"] for m in class_moves]))
+        .all()
+    )
+    moved_pt = PTSession.query.filter(PTSession.id.in_([m["id"] for m in pt_moves])).all()
+    record_changes("class_sessions", "updated", [(c.id, row_data(c)) for c in moved_classes])
+    record_changes("pt_sessions", "updated", [(p.id, row_data(p)) for p in moved_pt])
+    updates = [class_session_event(c) for c in moved_classes] + [pt_session_event(p) for p in moved_pt]
     db.session.commit()
-    return pt_session
+    publish_events(*updates)
+
+    return {"moved": len(moves), "unplaced": []}
 
 
 def get_admin_portal_data():
     trainers = get_all_trainers()
-    rooms = Room.query.order_by(Room.id).all()
+    rooms = get_all_rooms()
     members = get_all_members()
-    invoices = Invoice.query.order_by(Invoice.created_at.desc()).all()
-    class_sessions = ClassSession.query.order_by(ClassSession.start_time).all()
-    pt_sessions = PTSession.query.order_by(PTSession.start_time).all()
+    invoices = fetch(
+        InvoiceRow,
+        select(
+            Invoice.id,
+            Invoice.member_id,
+            Member.name,
+            Invoice.description,
+            Invoice.amount,
+            Invoice.status,
+            Invoice.created_at,
+            Invoice.paid_at,
+        )
+        .outerjoin(Member, Member.id == Invoice.member_id)
+        .order_by(Invoice.created_at.desc()),
+    )
+    class_sessions = fetch(ClassRow, class_rows_query())
+    pt_sessions = fetch(PTRow, pt_rows_query())
 
     return {
         "trainers": trainers,
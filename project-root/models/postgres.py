@@ -0,0 +1,79 @@
+"""
+Server-side prepared statements for Postgres.
+
+psycopg 3 (postgresql+psycopg:// URLs) prepares a statement on the server
+once the same SQL has run PG_PREPARE_THRESHOLD times on a connection, after
+which Postgres skips parsing and planning it. The hot queries in
+operations.py are prebuilt with bind parameters, so their SQL text never
+changes between calls and they are the ones that get prepared. psycopg2
+has no server-side prepare, so its URLs are left alone.
+
+Postgres also hands out serial ids before commit, so id 11 can commit while
+id 10 is still open. Tables that are read incrementally by id (the change
+log, health metrics for the metric store) stamp each row with its
+transaction id and are read with in_commit_order() instead.
+"""
+from sqlalchemy import BigInteger, literal, literal_column, tuple_
+from sqlalchemy.engine import make_url
+
+from . import db
+
+# the writing transaction, and the oldest one still running when a statement
+# starts; xid8 values never wrap around, unlike plain xids
+CURRENT_XID = literal_column("pg_current_xact_id()::text::bigint")
+XID_HORIZON = literal_column("pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+
+
+def _is_psycopg(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == "postgresql" and url.get_driver_name() == "psycopg"
+
+
+def _with_threshold(options, threshold):
+    connect_args = dict(options.get("connect_args") or {})
+    connect_args["prepare_threshold"] = threshold
+    return {**options, "connect_args": connect_args}
+
+
+def configure_prepared_statements(app):
+    """
+    Pass PG_PREPARE_THRESHOLD to every psycopg 3 engine. None turns
+    preparing off, as needed behind a transaction-pooling PgBouncer.
+    Runs before db.init_app() creates the engines.
+    """
+    threshold = app.config.get("PG_PREPARE_THRESHOLD", 5)
+
+    binds = app.config["SQLALCHEMY_BINDS"]
+    for key, value in list(binds.items()):
+        options = dict(value) if isinstance(value, dict) else {"url": value}
+        if _is_psycopg(options["url"]):
+            binds[key] = _with_threshold(options, threshold)
+
+    uri = app.config.get("SQLALCHEMY_DATABASE_URI")
+    if uri and _is_psycopg(uri):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = _with_threshold(
+            app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {}, threshold
+        )
+
+
+def is_postgres():
+    return db.session.get_bind().dialect.name == "postgresql"
+
+
+def in_commit_order(query, model, after_id, after_xid=None):
+    """
+    Restrict `query` to rows of `model` past the cursor (after_xid, after_id),
+    ordered so that rows committing later never sort before ones already read.
+
+    On Postgres rows are ordered by (xid, id) and only those written by
+    transactions older than every running one are returned, since nothing can
+    commit below that horizon any more. Without after_xid the cursor is just
+    an id. Other databases serialize writers, so ids are in commit order.
+    """
+    if not is_postgres():
+        return query.where(model.id > after_id).order_by(model.id)
+    if after_xid is None:
+        past = model.id > after_id
+    else:
+        past = tuple_(model.xid, model.id) > tuple_(literal(after_xid, BigInteger), after_id)
+    return query.where(past, model.xid < XID_HORIZON).order_by(model.xid, model.id)
@@ -0,0 +1,97 @@
+"""
+Read-only row records for listing pages.
+
+Listing queries select only the columns a page shows (with room, trainer
+and member names joined in) and wrap each row in a frozen, slotted
+dataclass, so rendering a long table builds no ORM entities, identity-map
+entries or lazy-loading relationships.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from . import db
+
+
+@dataclass(frozen=True, slots=True)
+class MemberRow:
+    id: int
+    name: str
+    email: str
+
+
+@dataclass(frozen=True, slots=True)
+class MemberSearchRow:
+    id: int
+    name: str
+    email: str
+    goal_id: Optional[int]
+    goal_description: Optional[str]
+    goal_target_weight_kg: Optional[float]
+    metric_id: Optional[int]
+    weight_kg: Optional[float]
+    heart_rate_bpm: Optional[float]
+    # set by the cross-site search
+    site: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class TrainerRow:
+    id: int
+    name: str
+    email: str
+
+
+@dataclass(frozen=True, slots=True)
+class RoomRow:
+    id: int
+    name: str
+    capacity: int
+
+
+@dataclass(frozen=True, slots=True)
+class ClassRow:
+    id: int
+    title: str
+    trainer_id: int
+    trainer_name: Optional[str]
+    room_id: int
+    room_name: Optional[str]
+    start_time: datetime
+    end_time: datetime
+    capacity: int
+
+
+@dataclass(frozen=True, slots=True)
+class PTRow:
+    id: int
+    member_id: int
+    member_name: Optional[str]
+    trainer_id: int
+    trainer_name: Optional[str]
+    room_id: int
+    room_name: Optional[str]
+    start_time: datetime
+    end_time: datetime
+    status: str
+
+
+@dataclass(frozen=True, slots=True)
+class InvoiceRow:
+    id: int
+    member_id: int
+    member_name: Optional[str]
+    description: Optional[str]
+    amount: Decimal
+    status: str
+    created_at: datetime
+    paid_at: Optional[datetime]
+
+
+def fetch(row_type, stmt, params=None):
+    """
+    Run a select whose columns are in the same order as row_type's fields
+    and return a list of row_type records.
+    """
+    return [row_type(*row) for row in db.session.execute(stmt, params).tuples()]
@@ -0,0 +1,526 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select
+
+from . import db, current_site
+from .schema import (
+    Member,
+    Trainer,
+    FitnessGoal,
+    HealthMetric,
+    ClassSession,
+    PTSession,
+    TrainerAvailability,
+)
+from .operations import parse_date
+
+
+# ---------- interval helpers ----------
+
+def merge_intervals(intervals):
+    """
+    Merge a list of (start, end) pairs into sorted, non-overlapping intervals.
+    Touching intervals are joined together.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def clip_intervals(intervals, start, end):
+    """
+    Clip sorted, merged intervals to [start, end).
+    """
+    clipped = []
+    for s, e in intervals:
+        if e <= start:
+            continue
+        if s >= end:
+            break
+        clipped.append((max(s, start), min(e, end)))
+    return clipped
+
+
+def subtract_intervals(intervals, holes):
+    """
+    Return the parts of `intervals` not covered by `holes`.
+    Both inputs must be sorted and merged.
+    """
+    result = []
+    i = 0
+    for start, end in intervals:
+        cursor = start
+        while i < len(holes) and holes[i][1] <= cursor:
+            i += 1
+        j = i
+        while j < len(holes) and holes[j][0] < end:
+            if holes[j][0] > cursor:
+                result.append((cursor, holes[j][0]))
+            cursor = max(cursor, holes[j][1])
+            j += 1
+        if cursor < end:
+            result.append((cursor, end))
+    return result
+
+
+def total_hours(intervals):
+    return sum((end - start).total_seconds() for start, end in intervals) / 3600.0
+
+
+def is_covered(merged, start, end):
+    """
+    True if [start, end) lies entirely inside one of the merged intervals.
+    """
+    idx = bisect_right(merged, (start, datetime.max)) - 1
+    return idx >= 0 and merged[idx][0] <= start and merged[idx][1] >= end
+
+
+def split_periods(start, end, period):
+    """
+    Split [start, end) into consecutive day, week or month buckets.
+    Weeks start on Monday; the first and last buckets are clipped to the range.
+    """
+    if period == "day":
+        cursor = datetime(start.year, start.month, start.day)
+    elif period == "week":
+        cursor = datetime(start.year, start.month, start.day) - timedelta(days=start.weekday())
+    elif period == "month":
+        cursor = datetime(start.year, start.month, 1)
+    else:
+        raise ValueError("Period must be day, week or month.")
+
+    periods = []
+    while cursor < end:
+        if period == "day":
+            nxt = cursor + timedelta(days=1)
+        elif period == "week":
+            nxt = cursor + timedelta(days=7)
+        elif cursor.month == 12:
+            nxt = datetime(cursor.year + 1, 1, 1)
+        else:
+            nxt = datetime(cursor.year, cursor.month + 1, 1)
+        periods.append((max(cursor, start), min(nxt, end)))
+        cursor = nxt
+    return periods
+
+
+# ---------- trainer utilization ----------
+
+def get_trainer_utilization_report(start_str, end_str, period="week", progress=None):
+    """
+    Available hours, booked hours, idle gaps and bookings outside availability
+    for every trainer and period in [start, end).
+
+    Uses one bulk fetch per table and interval arithmetic in Python rather than
+    per-trainer schedule lookups. `progress(fraction, message)` is called after
+    each trainer when given.
+    """
+    start_date = parse_date(start_str)
+    end_date = parse_date(end_str)
+    if not start_date or not end_date or start_date >= end_date:
+        raise ValueError("Invalid date range.")
+
+    start = datetime(start_date.year, start_date.month, start_date.day)
+    end = datetime(end_date.year, end_date.month, end_date.day)
+    periods = split_periods(start, end, period)
+
+    trainers = (
+        db.session.query(Trainer.id, Trainer.name)
+        .order_by(Trainer.name)
+        .all()
+    )
+
+    availability = {}
+    for trainer_id, s, e in (
+        db.session.query(
+            TrainerAvailability.trainer_id,
+            TrainerAvailability.start_time,
+            TrainerAvailability.end_time,
+        )
+        .filter(
+            TrainerAvailability.start_time < end,
+            TrainerAvailability.end_time > start,
+        )
+        .all()
+    ):
+        availability.setdefault(trainer_id, []).append((s, e))
+
+    bookings = {}
+    for trainer_id, session_id, title, s, e in (
+        db.session.query(
+            ClassSession.trainer_id,
+            ClassSession.id,
+            ClassSession.title,
+            ClassSession.start_time,
+            ClassSession.end_time,
+        )
+        .filter(ClassSession.start_time < end, ClassSession.end_time > start)
+        .all()
+    ):
+        bookings.setdefault(trainer_id, []).append(("class", session_id, title, s, e))
+
+    for trainer_id, session_id, s, e in (
+        db.session.query(
+            PTSession.trainer_id,
+            PTSession.id,
+            PTSession.start_time,
+            PTSession.end_time,
+        )
+        .filter(PTSession.start_time < end, PTSession.end_time > start)
+        .all()
+    ):
+        bookings.setdefault(trainer_id, []).append(("pt", session_id, "PT session", s, e))
+
+    rows = []
+    for index, (trainer_id, trainer_name) in enumerate(trainers, start=1):
+        available = merge_intervals(availability.get(trainer_id, []))
+        trainer_bookings = sorted(bookings.get(trainer_id, []), key=lambda b: b[3])
+        booked = merge_intervals([(b[3], b[4]) for b in trainer_bookings])
+
+        for period_start, period_end in periods:
+            period_available = clip_intervals(available, period_start, period_end)
+            period_booked = clip_intervals(booked, period_start, period_end)
+            idle_gaps = subtract_intervals(period_available, period_booked)
+            unavailable_booked = subtract_intervals(period_booked, period_available)
+
+            outside = [
+                {
+                    "kind": kind,
+                    "id": session_id,
+                    "title": title,
+                    "start_time": s,
+                    "end_time": e,
+                }
+                for kind, session_id, title, s, e in trainer_bookings
+                # each booking is reported once, in the period where it starts
+                if period_start <= max(s, start) < period_end
+                and not is_covered(available, s, e)
+            ]
+
+            available_hours = total_hours(period_available)
+            booked_hours = total_hours(period_booked)
+            rows.append(
+                {
+                    "trainer_id": trainer_id,
+                    "trainer_name": trainer_name,
+                    "period_start": period_start,
+                    "period_end": period_end,
+                    "available_hours": available_hours,
+                    "booked_hours": booked_hours,
+                    "idle_hours": total_hours(idle_gaps),
+                    "outside_hours": total_hours(unavailable_booked),
+                    "utilization": (
+                        (booked_hours - total_hours(unavailable_booked)) / available_hours
+                        if available_hours
+                        else None
+                    ),
+                    "idle_gaps": idle_gaps,
+                    "outside_bookings": outside,
+                }
+            )
+
+        if progress:
+            progress(index / len(trainers), f"{index} of {len(trainers)} trainers")
+
+    return {
+        "start": start,
+        "end": end,
+        "period": period,
+        "rows": rows,
+    }
+
+
+# ---------- roster progress ----------
+
+# trend window for weight velocity and heart rate slopes
+TREND_WINDOW_DAYS = 90
+# readings in the window must span at least this long before a per-week
+# slope means anything; two readings minutes apart would extrapolate wildly
+TREND_MIN_SPAN_DAYS = 7
+
+# metric rows fetched per round trip while building the roster arrays
+ROSTER_BATCH_SIZE = 50000
+
+EPOCH = datetime(1970, 1, 1)
+
+# (site, trainer id or None) -> (metric version, results)
+_roster_cache = {}
+roster_cache_stats = {"hit": 0, "miss": 0}
+
+EMPTY_PROGRESS = {
+    "metrics_count": 0,
+    "last_recorded_at": None,
+    "height_cm": None,
+    "weight_kg": None,
+    "bmi": None,
+    "heart_rate_bpm": None,
+    "goal_description": None,
+    "target_weight_kg": None,
+    "baseline_weight_kg": None,
+    "goal_progress": None,
+    "weight_velocity_kg_per_week": None,
+    "heart_rate_trend_bpm_per_week": None,
+}
+
+
+def get_metric_version():
+    """
+    Cheap fingerprint that changes whenever a health metric, goal or PT
+    session (which can add a client to a trainer's roster) is added. These
+    tables are insert-only (replacing a goal inserts a new row), so the
+    newest ids are enough and each is a single primary key index lookup.
+    """
+    return tuple(
+        db.session.execute(
+            select(
+                select(func.max(HealthMetric.id)).scalar_subquery(),
+                select(func.max(FitnessGoal.id)).scalar_subquery(),
+                select(func.max(PTSession.id)).scalar_subquery(),
+            )
+        ).one()
+    )
+
+
+def _epoch_seconds(column):
+    """
+    SQL expression for a timestamp column as seconds since 1970-01-01, so the
+    driver hands back floats instead of parsed datetimes.
+    """
+    if db.session.get_bind().dialect.name == "postgresql":
+        return func.extract("epoch", column)
+    return (func.julianday(column) - 2440587.5) * 86400.0
+
+
+def _first_in_group(mask, starts, n):
+    """
+    Index of the first row in each group where mask holds, or n when none does.
+    """
+    return np.minimum.reduceat(np.where(mask, np.arange(n), n), starts)
+
+
+def _last_in_group(mask, starts, n):
+    """
+    Index of the last row in each group where mask holds, or n when none does.
+    """
+    last = np.maximum.reduceat(np.where(mask, np.arange(n), -1), starts)
+    return np.where(last < 0, n, last)
+
+
+def _pick(values, index):
+    # index n (no matching row) reads the NaN appended at the end
+    return np.append(values, np.nan)[index]
+
+
+def _slopes(t, y, included, starts, min_span):
+    """
+    Least-squares slope of y over t per group, using only included rows.
+    Groups whose included rows span less than min_span get NaN.
+    """
+    span = np.maximum.reduceat(np.where(included, t, -np.inf), starts) - np.minimum.reduceat(
+        np.where(included, t, np.inf), starts
+    )
+    t = np.where(included, t, 0.0)
+    y = np.where(included, y, 0.0)
+    n, st, sy, stt, sty = (
+        np.add.reduceat(column, starts)
+        for column in (included.astype(float), t, y, t * t, t * y)
+    )
+    denominator = n * stt - st * st
+    ok = (n >= 2) & (span >= min_span) & (denominator != 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(ok, (n * sty - st * sy) / np.where(ok, denominator, 1.0), np.nan)
+
+
+def _optional(values):
+    return [None if v != v else v for v in values.tolist()]
+
+
+def _compute_roster(member_ids=None):
+    """
+    Progress stats for the given members (a subquery of ids) or every member
+    of the current site. Metrics are bulk-fetched into column arrays sorted
+    by member and newest first, and every statistic is computed for all
+    members at once with reductions over the member boundaries.
+    Returns {member_id: stats}.
+    """
+    goal_query = (
+        db.session.query(
+            FitnessGoal.member_id,
+            FitnessGoal.description,
+            FitnessGoal.target_weight_kg,
+            FitnessGoal.created_at,
+        )
+        .filter(FitnessGoal.is_active.is_(True))
+        .order_by(FitnessGoal.member_id, FitnessGoal.created_at, FitnessGoal.id)
+    )
+    metric_query = select(
+        HealthMetric.member_id,
+        _epoch_seconds(HealthMetric.recorded_at),
+        HealthMetric.height_cm,
+        HealthMetric.weight_kg,
+        HealthMetric.heart_rate_bpm,
+    )
+    latest_query = select(HealthMetric.member_id, func.max(HealthMetric.recorded_at)).group_by(
+        HealthMetric.member_id
+    )
+
+    if member_ids is not None:
+        goal_query = goal_query.filter(FitnessGoal.member_id.in_(member_ids))
+        metric_query = metric_query.where(HealthMetric.member_id.in_(member_ids))
+        latest_query = latest_query.where(HealthMetric.member_id.in_(member_ids))
+
+    # the newest active goal wins
+    goals = {row[0]: row[1:] for row in goal_query.all()}
+
+    # stream plain tuples on the session's connection into column arrays a
+    # batch at a time, so no row objects pile up; None becomes NaN
+    result = db.session.connection().execution_options(yield_per=ROSTER_BATCH_SIZE).execute(
+        metric_query
+    )
+    batches = [
+        [np.array(column, dtype=float) for column in zip(*batch)]
+        for batch in result.partitions()
+    ]
+
+    results = {}
+    if batches:
+        member, seconds, height, weight, heart_rate = (np.concatenate(c) for c in zip(*batches))
+        n = len(member)
+        member = member.astype(np.int64)
+        # by member, newest first; sorting the arrays is cheaper than in SQL
+        order = np.lexsort((-seconds, member))
+        member = member[order]
+        seconds = seconds[order]
+        height = height[order]
+        weight = weight[order]
+        heart_rate = heart_rate[order]
+        # a zero reading counts as not recorded
+        has_height = ~np.isnan(height) & (height != 0)
+        has_weight = ~np.isnan(weight) & (weight != 0)
+        has_heart_rate = ~np.isnan(heart_rate) & (heart_rate != 0)
+
+        starts = np.flatnonzero(np.r_[True, member[1:] != member[:-1]])
+        counts = np.diff(np.r_[starts, n])
+        group = np.repeat(np.arange(len(starts)), counts)
+        ids = member[starts].tolist()
+
+        latest_seconds = seconds[starts][group]
+        height_cm = _pick(height, _first_in_group(has_height, starts, n))
+        weight_kg = _pick(weight, _first_in_group(has_weight, starts, n))
+        heart_rate_bpm = _pick(heart_rate, _first_in_group(has_heart_rate, starts, n))
+
+        # baseline is the last weight at or before the goal was set, or the
+        # earliest weight after it when nothing older exists
+        goal_seconds = np.array(
+            [(goals[m][2] - EPOCH).total_seconds() if m in goals else None for m in ids],
+            dtype=float,
+        )
+        has_goal = np.array([m in goals for m in ids])
+        target = np.array([goals[m][1] if m in goals else None for m in ids], dtype=float)
+        before_goal = has_weight & has_goal[group] & (seconds <= goal_seconds[group])
+        last_before = _first_in_group(before_goal, starts, n)
+        first_weight = _pick(weight, _last_in_group(has_weight, starts, n))
+        baseline = np.where(last_before < n, _pick(weight, last_before), first_weight)
+        baseline = np.where(has_goal, baseline, np.nan)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bmi = weight_kg / (height_cm / 100.0) ** 2
+            progress = np.clip((baseline - weight_kg) / (baseline - target), 0.0, 1.0)
+        progress = np.where(baseline != target, progress, np.nan)
+
+        t = (seconds - latest_seconds) / (7 * 24 * 3600.0)
+        in_window = seconds >= latest_seconds - TREND_WINDOW_DAYS * 24 * 3600.0
+        min_span = TREND_MIN_SPAN_DAYS / 7.0
+        weight_velocity = _slopes(t, weight, in_window & has_weight, starts, min_span)
+        heart_rate_trend = _slopes(t, heart_rate, in_window & has_heart_rate, starts, min_span)
+
+        # exact timestamps for display, one per member
+        latest_at = dict(db.session.connection().execute(latest_query).all())
+
+        for values in zip(
+            ids,
+            counts.tolist(),
+            [latest_at[m] for m in ids],
+            _optional(height_cm),
+            _optional(weight_kg),
+            _optional(bmi),
+            _optional(heart_rate_bpm),
+            _optional(baseline),
+            _optional(progress),
+            _optional(weight_velocity),
+            _optional(heart_rate_trend),
+        ):
+            member_id = values[0]
+            description, target_weight, _ = goals.get(member_id, (None, None, None))
+            results[member_id] = {
+                "metrics_count": values[1],
+                "last_recorded_at": values[2],
+                "height_cm": values[3],
+                "weight_kg": values[4],
+                "bmi": values[5],
+                "heart_rate_bpm": values[6],
+                "goal_description": description,
+                "target_weight_kg": target_weight,
+                "baseline_weight_kg": values[7],
+                "goal_progress": values[8],
+                "weight_velocity_kg_per_week": values[9],
+                "heart_rate_trend_bpm_per_week": values[10],
+            }
+
+    # members with a goal but no metrics yet
+    for member_id, (description, target, _) in goals.items():
+        if member_id not in results:
+            results[member_id] = dict(
+                EMPTY_PROGRESS,
+                goal_description=description,
+                target_weight_kg=target,
+            )
+
+    return results
+
+
+def get_roster_progress(trainer_id=None):
+    """
+    Goal progress, BMI, weight velocity and heart rate trend for a trainer's
+    PT clients, or for every member when trainer_id is None. Computed results
+    are cached until a new metric, goal or PT session is recorded.
+    """
+    members_query = db.session.query(Member.id, Member.name, Member.email).order_by(Member.name)
+    member_ids = None
+
+    if trainer_id is not None:
+        trainer = db.session.get(Trainer, trainer_id)
+        if not trainer:
+            raise ValueError("Trainer not found.")
+        member_ids = (
+            select(PTSession.member_id)
+            .where(PTSession.trainer_id == trainer_id)
+            .distinct()
+            .scalar_subquery()
+        )
+        members_query = members_query.filter(Member.id.in_(member_ids))
+
+    version = get_metric_version()
+    scope = (current_site.get(), trainer_id)
+    cached = _roster_cache.get(scope)
+    if cached is not None and cached[0] == version:
+        roster_cache_stats["hit"] += 1
+        stats = cached[1]
+    else:
+        roster_cache_stats["miss"] += 1
+        stats = _compute_roster(member_ids)
+        _roster_cache[scope] = (version, stats)
+
+    rows = []
+    for member_id, name, email in members_query.all():
+        row = {"member_id": member_id, "name": name, "email": email}
+        row.update(stats.get(member_id, EMPTY_PROGRESS))
+        rows.append(row)
+    return rows
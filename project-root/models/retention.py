@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, literal_column, select
+from sqlalchemy.types import Date
+
+from . import db
+from .schema import (
+    Member,
+    ClassSession,
+    ClassRegistration,
+    RetentionCohort,
+    RetentionWeek,
+)
+
+
+def week_start(column):
+    """
+    SQL expression for the Monday starting the week of a timestamp column.
+    Literal arguments keep the expression identical in SELECT and GROUP BY.
+    """
+    if db.session.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(literal_column("'week'"), column).cast(Date)
+    # SQLite: move forward to Sunday, then back to that week's Monday
+    return func.date(column, literal_column("'weekday 0'"), literal_column("'-6 days'"), type_=Date)
+
+
+def _monday(value):
+    return datetime(value.year, value.month, value.day) - timedelta(days=value.weekday())
+
+
+def refresh_retention(full=False):
+    """
+    Rebuild the precomputed cohort tables. Only the latest stored week and
+    cohort (which may have been partial) and anything after them are
+    recomputed unless full is set. Attendance counts classes that have
+    already started.
+    """
+    now = datetime.utcnow()
+
+    if full:
+        db.session.execute(delete(RetentionWeek))
+        db.session.execute(delete(RetentionCohort))
+        from_week = from_cohort = None
+    else:
+        from_week = db.session.query(func.max(RetentionWeek.activity_week)).scalar()
+        from_cohort = db.session.query(func.max(RetentionCohort.cohort_week)).scalar()
+
+    cohort = week_start(Member.created_at)
+    cohort_query = select(cohort, func.count(Member.id)).group_by(cohort)
+    if from_cohort is not None:
+        from_cohort = _monday(from_cohort)
+        db.session.execute(
+            delete(RetentionCohort).where(RetentionCohort.cohort_week >= from_cohort.date())
+        )
+        cohort_query = cohort_query.where(Member.created_at >= from_cohort)
+    db.session.execute(
+        insert(RetentionCohort).from_select(["cohort_week", "members"], cohort_query)
+    )
+
+    activity = week_start(ClassSession.start_time)
+    week_query = (
+        select(
+            cohort,
+            activity,
+            func.count(func.distinct(ClassRegistration.member_id)),
+            func.count(ClassRegistration.id),
+        )
+        .select_from(ClassRegistration)
+        .join(ClassSession, ClassRegistration.class_session_id == ClassSession.id)
+        .join(Member, ClassRegistration.member_id == Member.id)
+        .where(ClassSession.start_time < now)
+        .group_by(cohort, activity)
+    )
+    if from_week is not None:
+        from_week = _monday(from_week)
+        db.session.execute(
+            delete(RetentionWeek).where(RetentionWeek.activity_week >= from_week.date())
+        )
+        week_query = week_query.where(ClassSession.start_time >= from_week)
+    db.session.execute(
+        insert(RetentionWeek).from_select(
+            ["cohort_week", "activity_week", "active_members", "attendances"], week_query
+        )
+    )
+
+    db.session.commit()
+    return {
+        "from_week": from_week.date() if from_week else None,
+        "from_cohort": from_cohort.date() if from_cohort else None,
+    }
+
+
+def get_retention_matrix(max_weeks=12):
+    """
+    Cohort-by-week retention from the precomputed tables. Each cohort row
+    has one cell per week since joining (0 = the joining week) with active
+    members, attendances and the share of the cohort that attended.
+    """
+    sizes = dict(
+        db.session.query(RetentionCohort.cohort_week, RetentionCohort.members)
+        .order_by(RetentionCohort.cohort_week)
+        .all()
+    )
+    cells = {
+        cohort_week: [None] * (max_weeks + 1) for cohort_week in sizes
+    }
+    # weighted average across cohorts for each week offset
+    offset_active = [0] * (max_weeks + 1)
+    offset_members = [0] * (max_weeks + 1)
+
+    for cohort_week, activity_week, active, attendances in db.session.query(
+        RetentionWeek.cohort_week,
+        RetentionWeek.activity_week,
+        RetentionWeek.active_members,
+        RetentionWeek.attendances,
+    ):
+        offset = (activity_week - cohort_week).days // 7
+        if cohort_week not in sizes or offset < 0 or offset > max_weeks:
+            continue
+        size = sizes[cohort_week]
+        cells[cohort_week][offset] = {
+            "active_members": active,
+            "attendances": attendances,
+            "rate": active / size if size else None,
+        }
+
+    today = datetime.utcnow().date()
+    for cohort_week, size in sizes.items():
+        # only weeks that have started count towards the average
+        elapsed = min((today - cohort_week).days // 7, max_weeks)
+        for offset in range(elapsed + 1):
+            cell = cells[cohort_week][offset]
+            offset_active[offset] += cell["active_members"] if cell else 0
+            offset_members[offset] += size
+
+    return {
+        "max_weeks": max_weeks,
+        "cohorts": [
+            {"cohort_week": cohort_week, "members": sizes[cohort_week], "weeks": cells[cohort_week]}
+            for cohort_week in sizes
+        ],
+        "average": [
+            offset_active[i] / offset_members[i] if offset_members[i] else None
+            for i in range(max_weeks + 1)
+        ],
+    }
@@ -65,6 +65,10 @@ class FitnessGoal(db.Model):
 
 class HealthMetric(db.Model):
     __tablename__ = "health_metrics"
+    __table_args__ = (
+        # the metric store sync order on Postgres; elsewhere xid stays NULL
+        db.Index("idx_health_metrics_xid", "xid", "id").ddl_if(dialect="postgresql"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     member_id = db.Column(db.Integer, db.ForeignKey("members.id"), nullable=False)
@@ -72,6 +76,8 @@ class HealthMetric(db.Model):
     weight_kg = db.Column(db.Float, nullable=True)
     heart_rate_bpm = db.Column(db.Float, nullable=True)
     recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # writing transaction on Postgres, see models/postgres.py
+    xid = db.Column(db.BigInteger, nullable=True)
 
     member = db.relationship("Member", back_populates="metrics")
 
@@ -158,3 +164,64 @@ class Invoice(db.Model):
     payment_method = db.Column(db.String(50), nullable=True)
 
     member = db.relationship("Member", back_populates="invoices")
+
+
+class Job(db.Model):
+    __tablename__ = "jobs"
+    __table_args__ = (db.Index("idx_jobs_status_run_after", "status", "run_after"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(60), nullable=False)
+    payload = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), default="Queued", nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    progress = db.Column(db.Float, default=0.0)
+    message = db.Column(db.String(255), nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    locked_by = db.Column(db.String(120), nullable=True)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind} {self.status}>"
+
+
+class RetentionCohort(db.Model):
+    __tablename__ = "retention_cohorts"
+
+    cohort_week = db.Column(db.Date, primary_key=True)
+    members = db.Column(db.Integer, nullable=False)
+
+
+class RetentionWeek(db.Model):
+    __tablename__ = "retention_weeks"
+
+    cohort_week = db.Column(db.Date, primary_key=True)
+    activity_week = db.Column(db.Date, primary_key=True)
+    active_members = db.Column(db.Integer, nullable=False)
+    attendances = db.Column(db.Integer, nullable=False)
+
+
+class ChangeEvent(db.Model):
+    __tablename__ = "change_events"
+    __table_args__ = (
+        db.Index("idx_change_events_created_at", "created_at"),
+        # the feed order on Postgres; elsewhere xid stays NULL
+        db.Index("idx_change_events_xid", "xid", "id").ddl_if(dialect="postgresql"),
+        # SQLite would otherwise reuse the ids of pruned rows
+        {"sqlite_autoincrement": True},
+    )
+
+    # the id doubles as the feed cursor, so ids must never be reused
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(60), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(20), nullable=False)
+    data = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # writing transaction on Postgres, see models/postgres.py
+    xid = db.Column(db.BigInteger, nullable=True)
@@ -0,0 +1,35 @@
+-- SQLite versions of the indexes and triggers in setup.sql.
+-- Applied automatically to tuned SQLite databases at startup.
+
+-- Index on members email
+CREATE INDEX IF NOT EXISTS idx_members_email ON members(email);
+
+
+-- Trigger to enforce class capacity
+CREATE TRIGGER IF NOT EXISTS trg_check_class_capacity
+BEFORE INSERT ON class_registrations
+FOR EACH ROW
+WHEN (
+    SELECT COUNT(*)
+    FROM class_registrations
+    WHERE class_session_id = NEW.class_session_id
+) >= (
+    SELECT capacity
+    FROM class_sessions
+    WHERE id = NEW.class_session_id
+)
+BEGIN
+    SELECT RAISE(ABORT, 'Class is full');
+END;
+
+
+-- Trigger to set paid_at when status becomes Paid.
+-- SQLite cannot assign NEW in a BEFORE trigger, so fill it in afterwards,
+-- keeping a timestamp the application already set.
+CREATE TRIGGER IF NOT EXISTS trg_set_paid_at
+AFTER UPDATE OF status ON invoices
+FOR EACH ROW
+WHEN NEW.status = 'Paid' AND OLD.status IS NOT 'Paid' AND NEW.paid_at IS NULL
+BEGIN
+    UPDATE invoices SET paid_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+END;
@@ -0,0 +1,146 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import replace
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from . import db, current_site, site_bind_key
+from .schema import (
+    Member,
+    Trainer,
+    Room,
+    ClassSession,
+    PTSession,
+    Invoice,
+)
+
+
+# ---------- site routing ----------
+
+def default_site():
+    return current_app.config.get("DEFAULT_SITE", "main")
+
+
+def get_sites():
+    """
+    All configured club sites; the default database is always the first one.
+    """
+    return [default_site()] + list(current_app.config.get("SITE_DATABASES") or {})
+
+
+def is_multi_site():
+    return bool(current_app.config.get("SITE_DATABASES"))
+
+
+@contextmanager
+def use_site(site):
+    """
+    Route every db.session statement inside the block to the given site's
+    database. Each site gets its own session, which is removed on exit.
+    """
+    if site is None or site == default_site():
+        token = current_site.set(None)
+        try:
+            yield
+        finally:
+            current_site.reset(token)
+        return
+
+    if site not in (current_app.config.get("SITE_DATABASES") or {}):
+        raise ValueError("Unknown site.")
+
+    token = current_site.set(site)
+    try:
+        yield
+    finally:
+        db.session.remove()
+        current_site.reset(token)
+
+
+def init_sites(app):
+    """
+    Create the schema and default rooms in every site database.
+    Must be called inside an app context.
+    """
+    from .operations import ensure_default_rooms
+
+    for site in app.config.get("SITE_DATABASES") or {}:
+        db.metadata.create_all(db.engines[site_bind_key(site)])
+        with use_site(site):
+            ensure_default_rooms()
+
+
+def scatter_gather(fn, *args, sites=None, **kwargs):
+    """
+    Run fn(*args, **kwargs) against every site in parallel threads and
+    return {site: result}.
+    """
+    app = current_app._get_current_object()
+    sites = sites or get_sites()
+
+    def run(site):
+        with app.app_context():
+            with use_site(site):
+                return fn(*args, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=len(sites)) as pool:
+        futures = {site: pool.submit(run, site) for site in sites}
+        return {site: future.result() for site, future in futures.items()}
+
+
+# ---------- cross-site queries ----------
+
+def search_members_all_sites(term):
+    """
+    search_members_by_name across every site, merged by name, with each
+    row's site filled in.
+    """
+    from .operations import search_members_by_name
+
+    results = []
+    for site, site_results in scatter_gather(search_members_by_name, term).items():
+        for result in site_results:
+            results.append(replace(result, site=site))
+    results.sort(key=lambda r: (r.name, r.site))
+    return results
+
+
+def get_site_totals():
+    """
+    Headline counts and invoice amounts for the current site in one query.
+    """
+    def count(model):
+        return select(func.count(model.id)).scalar_subquery()
+
+    def invoice_sum(status):
+        return (
+            select(func.coalesce(func.sum(Invoice.amount), 0))
+            .where(Invoice.status == status)
+            .scalar_subquery()
+        )
+
+    row = db.session.execute(
+        select(
+            count(Member).label("members"),
+            count(Trainer).label("trainers"),
+            count(Room).label("rooms"),
+            count(ClassSession).label("class_sessions"),
+            count(PTSession).label("pt_sessions"),
+            invoice_sum("Unpaid").label("unpaid_amount"),
+            invoice_sum("Paid").label("paid_amount"),
+        )
+    ).one()
+    return dict(row._mapping)
+
+
+def get_admin_totals():
+    """
+    Per-site totals plus a grand total across all sites.
+    """
+    per_site = scatter_gather(get_site_totals)
+    total = {}
+    for totals in per_site.values():
+        for key, value in totals.items():
+            total[key] = total.get(key, 0) + value
+    return {"sites": per_site, "total": total}
@@ -0,0 +1,123 @@
+"""
+Tuned single-box SQLite mode.
+
+Every file-backed SQLite database gets two engines: a writer with exactly
+one connection, whose transactions start with BEGIN IMMEDIATE so a whole
+check-then-write operation holds the write lock and writers queue for it
+instead of failing with "database is locked", and a pool of reader
+connections that run in WAL mode alongside the writer without blocking on
+it. SiteSession picks the writer while write_intent is set (non-GET
+requests) and the readers otherwise.
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from . import db, read_bind_key
+
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    # with WAL, NORMAL only risks the last commits on power loss, never corruption
+    ("synchronous", "NORMAL"),
+    ("cache_size", -64000),
+    ("mmap_size", 256 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),
+)
+
+SETUP_SQL = os.path.join(os.path.dirname(__file__), "setup_sqlite.sql")
+
+
+def _is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def _bind_options(value):
+    return dict(value) if isinstance(value, dict) else {"url": value}
+
+
+def configure_sqlite_binds(app):
+    """
+    Give every SQLite file bind a single-connection writer pool and add a
+    reader bind next to it. Runs before db.init_app() creates the engines.
+    """
+    read_pool_size = app.config.get("SQLITE_READ_POOL_SIZE", 8)
+    writer = {"pool_size": 1, "max_overflow": 0, "pool_timeout": 30}
+    reader = {"pool_size": read_pool_size, "max_overflow": 0, "pool_timeout": 30}
+
+    binds = app.config["SQLALCHEMY_BINDS"]
+    for key, value in list(binds.items()):
+        options = _bind_options(value)
+        if _is_sqlite_file(options["url"]):
+            binds[key] = {**options, **writer}
+            binds[read_bind_key(key)] = {**options, **reader}
+
+    uri = app.config.get("SQLALCHEMY_DATABASE_URI")
+    if uri and _is_sqlite_file(uri):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            **(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {}),
+            **writer,
+        }
+        binds[read_bind_key(None)] = {
+            **(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {}),
+            "url": uri,
+            **reader,
+        }
+
+
+def _tune_engine(engine, writer):
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        if writer:
+            # the begin event below issues BEGIN IMMEDIATE instead of
+            # pysqlite's implicit BEGIN, which waits for the first write
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in PRAGMAS:
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    if writer:
+        @event.listens_for(engine, "begin")
+        def begin_transaction(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+    # Readers keep the implicit BEGIN: reads hold no snapshot, so an
+    # occasional write on a reader (startup) never trips over a stale one
+    # and simply waits out busy_timeout.
+
+
+def _tuned_bind_keys():
+    # writer binds are the ones that have a reader next to them
+    return [key for key in db.engines if read_bind_key(key) in db.engines]
+
+
+def init_sqlite(app):
+    """
+    Apply pragmas and transaction modes to the tuned SQLite engines. Must run
+    in an app context after init_db() and before anything connects.
+    """
+    if not app.config.get("SQLITE_TUNING", True):
+        return False
+
+    keys = _tuned_bind_keys()
+    for key in keys:
+        _tune_engine(db.engines[key], writer=True)
+        _tune_engine(db.engines[read_bind_key(key)], writer=False)
+    return bool(keys)
+
+
+def install_sqlite_triggers():
+    """
+    Create the SQLite versions of the setup.sql indexes and triggers on every
+    tuned database. The statements are idempotent.
+    """
+    with open(SETUP_SQL) as f:
+        script = f.read()
+    for key in _tuned_bind_keys():
+        raw = db.engines[key].raw_connection()
+        try:
+            raw.driver_connection.executescript(script)
+        finally:
+            raw.close()
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+# the app and models packages are imported from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """
+    App on a fresh SQLite file with the default rooms seeded. Tests run inside
+    its app context with writes sent to the write connection.
+    """
+    from config import Config
+
+    monkeypatch.setattr(Config, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(Config, "SITE_DATABASES", {})
+    monkeypatch.setattr(Config, "METRICS_ENABLED", False)
+    monkeypatch.setattr(Config, "SLOW_QUERY_MS", None)
+
+    from app import create_app
+    from models import db, use_writer
+
+    app = create_app()
+    with app.app_context(), use_writer():
+        yield app
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
@@ -0,0 +1,36 @@
+"""
+Change feed: events are recorded with their writes and paged by cursor.
+"""
+import pytest
+
+from models.changes import get_changes
+from models.operations import register_member
+
+
+@pytest.fixture
+def start(app):
+    # the default rooms are seeded with change events of their own
+    events, _ = get_changes(limit=1000)
+    return events[-1].id
+
+
+def test_register_records_change(start):
+    member = register_member("Ada", "ada@example.com", "", "", "")
+
+    events, has_more = get_changes(after=start)
+    assert [(e.entity, e.entity_id, e.action) for e in events] == [("members", member.id, "created")]
+    assert not has_more
+
+
+def test_pages_follow_cursor(start):
+    members = [register_member(f"M{i}", f"m{i}@example.com", "", "", "").id for i in range(5)]
+
+    first, has_more = get_changes(after=start, limit=3)
+    assert has_more
+    rest, has_more = get_changes(after=first[-1].id, limit=3)
+    assert not has_more
+    assert [e.entity_id for e in first + rest] == members
+
+
+def test_cursor_past_the_end(start):
+    assert get_changes(after=start) == ([], False)
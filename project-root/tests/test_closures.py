@@ -0,0 +1,116 @@
+"""
+Room closures: sessions move to the smallest free room that fits them, all
+together or not at all.
+"""
+from datetime import datetime
+
+import pytest
+
+from models import db, operations
+from models.operations import (
+    create_class_session,
+    create_pt_session,
+    create_trainer,
+    plan_room_closure,
+    reassign_room_closure,
+    register_member,
+    set_trainer_availability,
+)
+from models.schema import ClassSession, PTSession, Room
+
+CLOSED = 1
+CAPACITIES = {CLOSED: 20, 2: 30, 3: 10, 4: 15}
+# rooms 5 to 10 are small, and 5 is the first of them
+SMALL = 5
+
+
+def at(hour):
+    return datetime(2030, 1, 1, hour)
+
+
+def stamp(hour):
+    return f"2030-01-01T{hour:02d}:00"
+
+
+@pytest.fixture
+def trainers(app):
+    for room in Room.query.all():
+        room.capacity = CAPACITIES.get(room.id, SMALL)
+    db.session.commit()
+
+    first = create_trainer("Tom", "tom@example.com").id
+    set_trainer_availability(first, stamp(8), stamp(18))
+    return first, create_trainer("Tia", "tia@example.com").id
+
+
+def book(trainer, room, start, end, size):
+    return create_class_session("Class", trainer, room, stamp(start), stamp(end), size).id
+
+
+def class_rooms(*ids):
+    db.session.expire_all()
+    return [db.session.get(ClassSession, class_id).room_id for class_id in ids]
+
+
+def test_best_fit_by_capacity(trainers):
+    tom, tia = trainers
+    member = register_member("Ada", "ada@example.com", "", "", "").id
+    medium = book(tom, CLOSED, 9, 10, 12)
+    small = book(tom, CLOSED, 10, 11, 8)
+    pt = create_pt_session(member, tom, CLOSED, stamp(11), stamp(12)).id
+    book(tia, 4, 12, 13, 5)
+    # room 4 is taken at noon, so the next room up
+    crowded = book(tom, CLOSED, 12, 13, 12)
+    large = book(tom, CLOSED, 13, 14, 25)
+    later = book(tom, CLOSED, 16, 17, 5)
+
+    moves, unplaced = plan_room_closure(CLOSED, at(8), at(15))
+    assert moves == [
+        ("class", medium, 4),
+        ("class", small, 3),
+        ("pt", pt, SMALL),
+        ("class", crowded, 2),
+        ("class", large, 2),
+    ]
+    assert unplaced == []
+
+    assert reassign_room_closure(CLOSED, stamp(8), stamp(15)) == {"moved": 5, "unplaced": []}
+    assert class_rooms(medium, small, crowded, large, later) == [4, 3, 2, 2, CLOSED]
+    assert db.session.get(PTSession, pt).room_id == SMALL
+
+
+def test_unplaced_sessions_move_nothing(trainers):
+    tom, tia = trainers
+    fits = book(tom, CLOSED, 9, 10, 12)
+    too_big = book(tom, CLOSED, 10, 11, 40)
+    # the only room large enough is busy
+    book(tia, 2, 11, 12, 30)
+    blocked = book(tom, CLOSED, 11, 12, 25)
+
+    result = reassign_room_closure(CLOSED, stamp(8), stamp(15))
+
+    assert result["moved"] == 0
+    assert [(row.kind, row.id, row.size, row.start_time) for row in result["unplaced"]] == [
+        ("class", too_big, 40, at(10)),
+        ("class", blocked, 25, at(11)),
+    ]
+    assert class_rooms(fits, too_big, blocked) == [CLOSED, CLOSED, CLOSED]
+
+
+def test_clash_after_planning_rolls_back(trainers, monkeypatch):
+    tom, tia = trainers
+    first = book(tom, CLOSED, 9, 10, 12)
+    second = book(tom, CLOSED, 10, 11, 12)
+    book(tia, 2, 10, 11, 12)
+    # as if room 2 had been booked between planning and moving
+    monkeypatch.setattr(
+        operations, "plan_room_closure", lambda *args: ([("class", first, 4), ("class", second, 2)], [])
+    )
+
+    with pytest.raises(ValueError, match="Room bookings changed while reassigning"):
+        reassign_room_closure(CLOSED, stamp(8), stamp(15))
+    assert class_rooms(first, second) == [CLOSED, CLOSED]
+
+
+def test_nothing_booked(trainers):
+    assert reassign_room_closure(CLOSED, stamp(8), stamp(15)) == {"moved": 0, "unplaced": []}
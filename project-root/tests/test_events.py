@@ -0,0 +1,101 @@
+"""
+Live updates: writes publish their events without reading after commit,
+which would open another transaction on the write connection.
+"""
+import json
+
+import pytest
+
+from models import db, events
+from models.operations import (
+    create_class_session,
+    create_pt_session,
+    create_trainer,
+    register_member,
+    reassign_room_closure,
+    register_member_for_class,
+    set_trainer_availability,
+    update_class_session_room,
+    update_pt_session_room,
+)
+
+ROOM, OTHER_ROOM = 1, 2
+
+
+@pytest.fixture
+def subscription(app):
+    subscription = events.subscribe()
+    yield subscription
+    events.unsubscribe(subscription)
+
+
+@pytest.fixture
+def trainer(app):
+    trainer_id = create_trainer("Tom", "tom@example.com").id
+    set_trainer_availability(trainer_id, "2030-01-01T08:00", "2030-01-01T18:00")
+    return trainer_id
+
+
+@pytest.fixture
+def yoga(trainer):
+    return create_class_session("Yoga", trainer, ROOM, "2030-01-01T09:00", "2030-01-01T10:00", 2).id
+
+
+def no_transaction_left():
+    return not db.session().in_transaction()
+
+
+def published(subscription):
+    messages = []
+    while not subscription.empty():
+        event, payload = subscription.get_nowait()
+        messages.append((event, json.loads(payload)))
+    return messages
+
+
+def test_register_publishes_seats(yoga, subscription):
+    member = register_member("Ada", "ada@example.com", "", "", "").id
+    register_member_for_class(member, yoga)
+    assert no_transaction_left()
+
+    [(event, payload)] = published(subscription)
+    assert event == "class_seats"
+    assert (payload["class_session_id"], payload["registered"], payload["capacity"]) == (yoga, 1, 2)
+
+
+def test_create_and_move_class_publish_room(trainer, subscription):
+    class_id = create_class_session("Spin", trainer, ROOM, "2030-01-01T11:00", "2030-01-01T12:00", 5).id
+    update_class_session_room(class_id, OTHER_ROOM)
+    assert no_transaction_left()
+
+    messages = published(subscription)
+    assert [event for event, _ in messages] == ["class_session", "class_session"]
+    assert [payload["room_id"] for _, payload in messages] == [ROOM, OTHER_ROOM]
+    assert all(payload["room_name"] for _, payload in messages)
+
+
+def test_move_pt_publishes(trainer, subscription):
+    member = register_member("Ada", "ada@example.com", "", "", "").id
+    pt = create_pt_session(member, trainer, ROOM, "2030-01-01T11:00", "2030-01-01T12:00").id
+    update_pt_session_room(pt, OTHER_ROOM)
+    assert no_transaction_left()
+
+    [(event, payload)] = published(subscription)
+    assert (event, payload["id"], payload["room_id"]) == ("pt_session", pt, OTHER_ROOM)
+
+
+def test_room_closure_publishes_moves(yoga, trainer, subscription):
+    member = register_member("Ada", "ada@example.com", "", "", "").id
+    pt = create_pt_session(member, trainer, ROOM, "2030-01-01T11:00", "2030-01-01T12:00").id
+    published(subscription)
+
+    result = reassign_room_closure(ROOM, "2030-01-01T08:00", "2030-01-01T13:00")
+    assert no_transaction_left()
+
+    assert result["moved"] == 2
+    messages = published(subscription)
+    assert sorted((event, payload["id"]) for event, payload in messages) == [
+        ("class_session", yoga),
+        ("pt_session", pt),
+    ]
+    assert all(payload["room_id"] != ROOM for _, payload in messages)
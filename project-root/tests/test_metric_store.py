@@ -0,0 +1,108 @@
+"""
+Columnar metric store: export and the vectorized analytics on top of it.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db
+from models.metric_store import MetricStore, sync_metric_store
+from models.operations import register_member
+from models.schema import HealthMetric
+
+T0 = datetime(2030, 1, 1)
+
+# (member, days after T0, weight, heart rate)
+READINGS = [
+    (0, 0, 80.0, 70.0),
+    (0, 8, None, 68.0),
+    (0, 8, 79.0, None),
+    (1, 1, 60.0, 60.0),
+    (1, 2, 61.5, None),
+    (2, 3, None, 75.0),
+]
+
+
+@pytest.fixture
+def store(app, tmp_path):
+    members = [register_member(f"M{i}", f"m{i}@example.com", "", "", "").id for i in range(3)]
+    for member, days, weight, heart_rate in READINGS:
+        db.session.add(
+            HealthMetric(
+                member_id=members[member],
+                weight_kg=weight,
+                heart_rate_bpm=heart_rate,
+                recorded_at=T0 + timedelta(days=days),
+            )
+        )
+    db.session.commit()
+
+    assert sync_metric_store(str(tmp_path)) == len(READINGS)
+    with MetricStore.open(str(tmp_path)) as store:
+        store.members = members
+        yield store
+
+
+def test_sync_appends_only_new_rows(store, tmp_path):
+    db.session.add(HealthMetric(member_id=store.members[2], weight_kg=90.0, recorded_at=T0))
+    db.session.commit()
+
+    assert sync_metric_store(str(tmp_path)) == 1
+    assert sync_metric_store(str(tmp_path)) == 0
+    with MetricStore.open(str(tmp_path)) as reopened:
+        assert len(reopened) == len(READINGS) + 1
+        assert reopened.group_by("weight_kg", "last")[store.members[2]] == 90.0
+
+
+def test_sync_keeps_timestamps_and_nulls(store):
+    assert store.columns["recorded_at"][1] == (T0 + timedelta(days=8) - datetime(1970, 1, 1)).total_seconds()
+    assert store.group_by("weight_kg", "count") == {store.members[0]: 2, store.members[1]: 2}
+
+
+@pytest.mark.parametrize(
+    "agg, expected",
+    [
+        ("count", [2, 1, 1]),
+        ("sum", [138.0, 60.0, 75.0]),
+        ("mean", [69.0, 60.0, 75.0]),
+        ("min", [68.0, 60.0, 75.0]),
+        ("max", [70.0, 60.0, 75.0]),
+        ("last", [68.0, 60.0, 75.0]),
+    ],
+)
+def test_group_by_skips_nulls(store, agg, expected):
+    assert store.group_by("heart_rate_bpm", agg) == dict(zip(store.members, expected))
+
+
+def test_group_by_last_prefers_later_row_on_ties(store):
+    # both of member 0's day 8 rows have the same time; the weight one is later
+    assert store.group_by("weight_kg", "last")[store.members[0]] == 79.0
+
+
+def test_group_by_other_key(store):
+    assert store.group_by("weight_kg", "count", key="heart_rate_bpm") == {60.0: 1, 70.0: 1}
+
+
+def test_group_by_rejects_unknown_aggregate(store):
+    with pytest.raises(ValueError, match="Unknown aggregate."):
+        store.group_by("weight_kg", "median")
+
+
+def test_select_filters(store):
+    first, second, _ = store.members
+    assert store.select().tolist() == list(range(len(READINGS)))
+    assert store.select([second]).tolist() == [3, 4]
+    assert store.select(since=T0 + timedelta(days=2), until=T0 + timedelta(days=8)).tolist() == [4, 5]
+
+    rows = store.select([first, second], until=T0 + timedelta(days=2))
+    assert store.group_by("weight_kg", "mean", rows=rows) == {first: 80.0, second: 60.0}
+
+
+def test_cohort_series(store):
+    first, second, _ = store.members
+    series = store.cohort_series("weight_kg", [first, second], bucket_days=7)
+    # buckets are aligned to the epoch, so one starts at T0 + 2 days
+    assert series == [
+        (T0 - timedelta(days=5), 2, 70.0),
+        (T0 + timedelta(days=2), 2, 70.25),
+    ]
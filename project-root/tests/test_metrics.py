@@ -0,0 +1,77 @@
+"""
+/metrics across worker processes: snapshots in METRICS_DIR are added up.
+"""
+import os
+
+import pytest
+
+from app import metrics
+from app.metrics import Counter, Gauge, Histogram
+
+OTHER_PID = 999999
+
+
+@pytest.fixture
+def collectors(tmp_path, monkeypatch):
+    counter = Counter("requests_total", "Requests.", ("status",))
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    gauge = Gauge("open_streams", "Open streams.", lambda: 2)
+    monkeypatch.setattr(metrics, "_collectors", [counter, histogram, gauge])
+    monkeypatch.setattr(metrics, "_shared_dir", str(tmp_path))
+    return counter, histogram, gauge
+
+
+def other_worker(monkeypatch, counter, histogram):
+    # write a snapshot as another process would
+    counter.inc(("200",), 5)
+    histogram.observe((), 0.5)
+    with monkeypatch.context() as m:
+        m.setattr(os, "getpid", lambda: OTHER_PID)
+        metrics.flush_metrics()
+    counter._values.clear()
+    histogram._series.clear()
+
+
+def test_render_adds_up_workers(collectors, monkeypatch):
+    counter, histogram, _ = collectors
+    other_worker(monkeypatch, counter, histogram)
+    counter.inc(("200",))
+    counter.inc(("500",))
+    histogram.observe((), 0.05)
+
+    lines = metrics.render().splitlines()
+    assert 'requests_total{status="200"} 6' in lines
+    assert 'requests_total{status="500"} 1' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 2' in lines
+    assert "latency_seconds_count 2" in lines
+    assert f'open_streams{{pid="{os.getpid()}"}} 2' in lines
+    assert f'open_streams{{pid="{OTHER_PID}"}} 2' in lines
+
+
+def test_own_snapshot_is_not_counted_twice(collectors):
+    counter, _, _ = collectors
+    counter.inc(("200",), 3)
+    metrics.flush_metrics()
+    assert 'requests_total{status="200"} 3' in metrics.render().splitlines()
+
+
+def test_retired_worker_keeps_counts(collectors, monkeypatch, tmp_path):
+    counter, histogram, _ = collectors
+    other_worker(monkeypatch, counter, histogram)
+    metrics.retire_process(OTHER_PID)
+    metrics.retire_process(OTHER_PID)
+
+    assert sorted(os.listdir(tmp_path)) == [metrics.ARCHIVE]
+    lines = metrics.render().splitlines()
+    assert 'requests_total{status="200"} 5' in lines
+    assert "latency_seconds_count 1" in lines
+    # an exited worker's gauge is dropped
+    assert f'open_streams{{pid="{OTHER_PID}"}} 2' not in lines
+
+
+def test_clear_shared_metrics(collectors, monkeypatch, tmp_path):
+    counter, histogram, _ = collectors
+    other_worker(monkeypatch, counter, histogram)
+    metrics.clear_shared_metrics()
+    assert os.listdir(tmp_path) == []
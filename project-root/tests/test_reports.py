@@ -0,0 +1,204 @@
+"""
+Report helpers: interval arithmetic, trainer utilization and roster
+progress statistics.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db
+from models import reports
+from models.operations import (
+    create_class_session,
+    create_trainer,
+    register_member,
+    set_trainer_availability,
+)
+from models.reports import (
+    clip_intervals,
+    get_roster_progress,
+    get_trainer_utilization_report,
+    is_covered,
+    merge_intervals,
+    subtract_intervals,
+)
+from models.schema import HealthMetric
+
+NOW = datetime(2030, 1, 1, 12, 0)
+
+
+def at(hour, day=1):
+    return datetime(2030, 1, day, hour)
+
+
+@pytest.fixture(autouse=True)
+def fresh_roster_cache(app):
+    # the cache is keyed by site and metric ids, which repeat across test databases
+    reports._roster_cache.clear()
+
+
+def add_metrics(member_id, readings):
+    for recorded_at, weight, heart_rate in readings:
+        db.session.add(
+            HealthMetric(
+                member_id=member_id,
+                height_cm=180.0,
+                weight_kg=weight,
+                heart_rate_bpm=heart_rate,
+                recorded_at=recorded_at,
+            )
+        )
+    db.session.commit()
+
+
+def roster_row(member_id):
+    return next(row for row in get_roster_progress() if row["member_id"] == member_id)
+
+
+# ---------- interval helpers ----------
+
+@pytest.mark.parametrize(
+    "intervals, expected",
+    [
+        ([], []),
+        ([(at(9), at(10))], [(at(9), at(10))]),
+        # unsorted, overlapping and contained
+        ([(at(12), at(14)), (at(9), at(11)), (at(10), at(12)), (at(12), at(13))], [(at(9), at(14))]),
+        # touching intervals are joined, gaps are kept
+        ([(at(9), at(10)), (at(10), at(11)), (at(12), at(13))], [(at(9), at(11)), (at(12), at(13))]),
+    ],
+)
+def test_merge_intervals(intervals, expected):
+    assert merge_intervals(intervals) == expected
+
+
+@pytest.mark.parametrize(
+    "start, end, expected",
+    [
+        (at(8), at(20), [(at(9), at(11)), (at(13), at(15))]),
+        (at(10), at(14), [(at(10), at(11)), (at(13), at(14))]),
+        # the bounds only touch the intervals
+        (at(11), at(13), []),
+        (at(15), at(16), []),
+        (at(6), at(9), []),
+    ],
+)
+def test_clip_intervals(start, end, expected):
+    assert clip_intervals([(at(9), at(11)), (at(13), at(15))], start, end) == expected
+
+
+@pytest.mark.parametrize(
+    "holes, expected",
+    [
+        ([], [(at(9), at(12)), (at(14), at(17))]),
+        ([(at(10), at(11))], [(at(9), at(10)), (at(11), at(12)), (at(14), at(17))]),
+        # touching the edges takes nothing away
+        ([(at(8), at(9)), (at(12), at(14)), (at(17), at(18))], [(at(9), at(12)), (at(14), at(17))]),
+        # one hole across both intervals
+        ([(at(11), at(15))], [(at(9), at(11)), (at(15), at(17))]),
+        ([(at(8), at(18))], []),
+        ([(at(9), at(12)), (at(15), at(16))], [(at(14), at(15)), (at(16), at(17))]),
+    ],
+)
+def test_subtract_intervals(holes, expected):
+    assert subtract_intervals([(at(9), at(12)), (at(14), at(17))], holes) == expected
+
+
+@pytest.mark.parametrize(
+    "start, end, covered",
+    [
+        (at(9), at(12), True),
+        (at(10), at(11), True),
+        (at(8), at(10), False),
+        (at(11), at(15), False),
+        (at(12), at(13), False),
+    ],
+)
+def test_is_covered(start, end, covered):
+    assert is_covered([(at(9), at(12)), (at(14), at(17))], start, end) is covered
+
+
+# ---------- trainer utilization ----------
+
+def test_outside_booking_spanning_two_periods():
+    trainer = create_trainer("Tom", "tom@example.com").id
+    set_trainer_availability(trainer, "2030-01-07T08:00", "2030-01-07T18:00")
+    set_trainer_availability(trainer, "2030-01-14T08:00", "2030-01-14T18:00")
+    # Sunday night into Monday, across the week boundary and outside availability
+    late = create_class_session("Late", trainer, 1, "2030-01-13T23:00", "2030-01-14T01:00", 5).id
+    create_class_session("Spin", trainer, 1, "2030-01-14T09:00", "2030-01-14T10:00", 5)
+
+    first, second = get_trainer_utilization_report("2030-01-07", "2030-01-21", "week")["rows"]
+
+    assert (first["period_start"], second["period_start"]) == (at(0, 7), at(0, 14))
+    assert (first["available_hours"], first["booked_hours"], first["idle_hours"]) == (10.0, 1.0, 10.0)
+    assert (first["outside_hours"], first["utilization"]) == (1.0, 0.0)
+    assert (second["available_hours"], second["booked_hours"], second["idle_hours"]) == (10.0, 2.0, 9.0)
+    assert (second["outside_hours"], second["utilization"]) == (1.0, pytest.approx(0.1))
+    # reported once, in the period where it starts
+    assert [b["id"] for b in first["outside_bookings"]] == [late]
+    assert second["outside_bookings"] == []
+
+
+def test_outside_booking_starting_before_the_report():
+    trainer = create_trainer("Tom", "tom@example.com").id
+    early = create_class_session("Early", trainer, 1, "2030-01-06T23:00", "2030-01-07T01:00", 5).id
+
+    [row] = get_trainer_utilization_report("2030-01-07", "2030-01-14", "week")["rows"]
+
+    assert (row["booked_hours"], row["outside_hours"], row["utilization"]) == (1.0, 1.0, None)
+    assert [b["id"] for b in row["outside_bookings"]] == [early]
+
+
+# ---------- trends ----------
+
+def test_trend_over_two_weeks():
+    member = register_member("Ada", "ada@example.com", "", "", "").id
+    add_metrics(member, [(NOW - timedelta(days=14), 80.0, 70.0), (NOW, 78.0, 66.0)])
+
+    row = roster_row(member)
+    assert row["weight_velocity_kg_per_week"] == pytest.approx(-1.0)
+    assert row["heart_rate_trend_bpm_per_week"] == pytest.approx(-2.0)
+
+
+@pytest.mark.parametrize("gap", [timedelta(milliseconds=5), timedelta(hours=6), timedelta(days=6)])
+def test_no_trend_from_readings_close_together(gap):
+    member = register_member("Ada", "ada@example.com", "", "", "").id
+    add_metrics(member, [(NOW - gap, 80.0, 70.0), (NOW, 78.0, 66.0)])
+
+    row = roster_row(member)
+    assert row["weight_velocity_kg_per_week"] is None
+    assert row["heart_rate_trend_bpm_per_week"] is None
+    assert row["weight_kg"] == 78.0
+
+
+def test_trend_span_counts_only_the_window():
+    # the old reading is outside the trend window, leaving two close ones
+    member = register_member("Ada", "ada@example.com", "", "", "").id
+    add_metrics(
+        member,
+        [
+            (NOW - timedelta(days=reports.TREND_WINDOW_DAYS + 30), 90.0, 80.0),
+            (NOW - timedelta(days=1), 80.0, 70.0),
+            (NOW, 78.0, 66.0),
+        ],
+    )
+
+    assert roster_row(member)["weight_velocity_kg_per_week"] is None
+
+
+def test_trend_span_counts_only_rows_with_the_value():
+    # heart rate spans two weeks, weight only a few minutes of it
+    member = register_member("Ada", "ada@example.com", "", "", "").id
+    add_metrics(
+        member,
+        [
+            (NOW - timedelta(days=14), None, 70.0),
+            (NOW - timedelta(minutes=5), 80.0, None),
+            (NOW, 78.0, 66.0),
+        ],
+    )
+
+    row = roster_row(member)
+    assert row["weight_velocity_kg_per_week"] is None
+    assert row["heart_rate_trend_bpm_per_week"] == pytest.approx(-2.0)
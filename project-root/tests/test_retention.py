@@ -0,0 +1,84 @@
+"""
+Cohort retention: an incremental refresh matches a full rebuild.
+"""
+from datetime import date, datetime
+
+import pytest
+
+from models import db
+from models.operations import (
+    create_class_session,
+    create_trainer,
+    register_member,
+    register_member_for_class,
+)
+from models.retention import refresh_retention
+from models.schema import RetentionCohort, RetentionWeek
+
+# three Mondays, all in the past so every class counts as attended
+W1, W2, W3 = date(2020, 1, 6), date(2020, 1, 13), date(2020, 1, 20)
+
+
+@pytest.fixture
+def trainer(app):
+    return create_trainer("Tom", "tom@example.com").id
+
+
+def join(name, created_at):
+    member = register_member(name, f"{name.lower()}@example.com", "", "", "")
+    member.created_at = created_at
+    db.session.commit()
+    return member.id
+
+
+def attend(trainer, start, *members):
+    class_id = create_class_session("Spin", trainer, 1, start, start[:-5] + "23:00", 10).id
+    for member in members:
+        register_member_for_class(member, class_id)
+
+
+def tables():
+    cohorts = db.session.query(RetentionCohort.cohort_week, RetentionCohort.members)
+    weeks = db.session.query(
+        RetentionWeek.cohort_week,
+        RetentionWeek.activity_week,
+        RetentionWeek.active_members,
+        RetentionWeek.attendances,
+    )
+    return sorted(cohorts.all()), sorted(weeks.all())
+
+
+def test_incremental_refresh_after_partial_week(trainer):
+    ada = join("Ada", datetime(2020, 1, 7, 10))
+    bo = join("Bo", datetime(2020, 1, 9, 10))
+    attend(trainer, "2020-01-08T09:00", ada, bo)
+    attend(trainer, "2020-01-13T09:00", ada)
+    # W2 is the latest week so far, and W1 the latest cohort
+    assert refresh_retention(full=True) == {"from_week": None, "from_cohort": None}
+
+    # more of the partial cohort and week, then a new cohort and week
+    cy = join("Cy", datetime(2020, 1, 12, 20))
+    di = join("Di", datetime(2020, 1, 15, 10))
+    attend(trainer, "2020-01-17T09:00", bo, cy)
+    attend(trainer, "2020-01-21T09:00", ada, di)
+
+    assert refresh_retention() == {"from_week": W2, "from_cohort": W1}
+    incremental = tables()
+    assert incremental == (
+        [(W1, 3), (W2, 1)],
+        [(W1, W1, 2, 2), (W1, W2, 3, 3), (W1, W3, 1, 1), (W2, W3, 1, 1)],
+    )
+
+    refresh_retention(full=True)
+    assert tables() == incremental
+
+
+def test_incremental_refresh_without_changes(trainer):
+    ada = join("Ada", datetime(2020, 1, 7, 10))
+    attend(trainer, "2020-01-08T09:00", ada)
+    attend(trainer, "2020-01-21T09:00", ada)
+    refresh_retention()
+    before = tables()
+
+    assert refresh_retention() == {"from_week": W3, "from_cohort": W1}
+    assert tables() == before
@@ -0,0 +1,251 @@
+"""
+Booking checks: every reason validation_query can return surfaces as its
+VALIDATION_MESSAGES text, and the boundaries that must still be accepted.
+"""
+import re
+
+import pytest
+
+from models import db
+from models.operations import (
+    VALIDATION_MESSAGES,
+    PT_SESSION_CHECK,
+    REGISTRATION_CHECK,
+    _range_params,
+    create_class_session,
+    create_pt_session,
+    create_trainer,
+    raise_for_reason,
+    register_member,
+    register_member_for_class,
+    set_trainer_availability,
+    update_class_session_room,
+    update_pt_session_room,
+)
+
+MISSING = 9999
+ROOM, OTHER_ROOM = 1, 2
+
+
+def rejects(reason):
+    return pytest.raises(ValueError, match=f"^{re.escape(VALIDATION_MESSAGES[reason])}$")
+
+
+@pytest.fixture
+def member(app):
+    return register_member("Ada", "ada@example.com", "", "", "").id
+
+
+@pytest.fixture
+def trainer(app):
+    trainer_id = create_trainer("Tom", "tom@example.com").id
+    set_trainer_availability(trainer_id, "2030-01-01T08:00", "2030-01-01T18:00")
+    return trainer_id
+
+
+@pytest.fixture
+def other_trainer(app):
+    return create_trainer("Tia", "tia@example.com").id
+
+
+@pytest.fixture
+def yoga(trainer):
+    return create_class_session("Yoga", trainer, ROOM, "2030-01-01T09:00", "2030-01-01T10:00", 2).id
+
+
+# ---------- helpers ----------
+
+def test_raise_for_reason_passes_without_reason():
+    raise_for_reason(None)
+
+
+@pytest.mark.parametrize("reason", sorted(VALIDATION_MESSAGES))
+def test_raise_for_reason_uses_message(reason):
+    with rejects(reason):
+        raise_for_reason(reason)
+
+
+def test_first_failing_check_wins(app):
+    params = {"member_id": MISSING, "trainer_id": MISSING, "room_id": MISSING}
+    reason = db.session.execute(PT_SESSION_CHECK, {**params, **_range_params(None, None)}).scalar()
+    assert reason == "member_not_found"
+
+
+# ---------- class registration ----------
+
+def test_register_member_not_found(yoga):
+    with rejects("member_not_found"):
+        register_member_for_class(MISSING, yoga)
+
+
+def test_register_class_not_found(member):
+    with rejects("class_not_found"):
+        register_member_for_class(member, MISSING)
+
+
+def test_register_already_registered(member, yoga):
+    register_member_for_class(member, yoga)
+    with rejects("already_registered"):
+        register_member_for_class(member, yoga)
+
+
+def test_register_fills_capacity_exactly(member, yoga):
+    second = register_member("Bo", "bo@example.com", "", "", "").id
+    register_member_for_class(member, yoga)
+    register_member_for_class(second, yoga)
+
+    third = register_member("Cy", "cy@example.com", "", "", "").id
+    with rejects("class_full"):
+        register_member_for_class(third, yoga)
+
+
+def test_registration_check_full_at_capacity(member, yoga):
+    # the check itself, without the SQLite capacity trigger behind it
+    second = register_member("Bo", "bo@example.com", "", "", "").id
+    params = {"member_id": second, "class_session_id": yoga}
+    register_member_for_class(member, yoga)
+    assert db.session.execute(REGISTRATION_CHECK, params).scalar() is None
+
+    third = register_member("Cy", "cy@example.com", "", "", "").id
+    register_member_for_class(second, yoga)
+    params = {"member_id": third, "class_session_id": yoga}
+    assert db.session.execute(REGISTRATION_CHECK, params).scalar() == "class_full"
+
+
+# ---------- class sessions ----------
+
+def test_class_trainer_not_found(app):
+    with rejects("trainer_not_found"):
+        create_class_session("Spin", MISSING, ROOM, "2030-01-01T09:00", "2030-01-01T10:00", 10)
+
+
+def test_class_room_not_found(trainer):
+    with rejects("room_not_found"):
+        create_class_session("Spin", trainer, MISSING, "2030-01-01T09:00", "2030-01-01T10:00", 10)
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        ("2030-01-01T10:00", "2030-01-01T09:00"),
+        ("2030-01-01T09:00", "2030-01-01T09:00"),
+        ("not a date", "2030-01-01T10:00"),
+        ("", ""),
+    ],
+)
+def test_class_invalid_range(trainer, start, end):
+    with rejects("invalid_range"):
+        create_class_session("Spin", trainer, ROOM, start, end, 10)
+
+
+def test_class_room_conflict(yoga, other_trainer):
+    with rejects("room_conflict"):
+        create_class_session("Spin", other_trainer, ROOM, "2030-01-01T09:30", "2030-01-01T10:30", 10)
+
+
+def test_class_trainer_conflict(yoga, trainer):
+    with rejects("trainer_conflict"):
+        create_class_session("Spin", trainer, OTHER_ROOM, "2030-01-01T08:30", "2030-01-01T09:30", 10)
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [("2030-01-01T08:00", "2030-01-01T09:00"), ("2030-01-01T10:00", "2030-01-01T11:00")],
+)
+def test_class_touching_intervals_allowed(yoga, trainer, start, end):
+    # same room and trainer, ending or starting exactly at the existing class
+    create_class_session("Spin", trainer, ROOM, start, end, 10)
+
+
+# ---------- PT sessions ----------
+
+def test_pt_member_not_found(trainer):
+    with rejects("member_not_found"):
+        create_pt_session(MISSING, trainer, ROOM, "2030-01-01T11:00", "2030-01-01T12:00")
+
+
+def test_pt_trainer_not_found(member):
+    with rejects("trainer_not_found"):
+        create_pt_session(member, MISSING, ROOM, "2030-01-01T11:00", "2030-01-01T12:00")
+
+
+def test_pt_room_not_found(member, trainer):
+    with rejects("room_not_found"):
+        create_pt_session(member, trainer, MISSING, "2030-01-01T11:00", "2030-01-01T12:00")
+
+
+def test_pt_invalid_range(member, trainer):
+    with rejects("invalid_range"):
+        create_pt_session(member, trainer, ROOM, "2030-01-01T12:00", "2030-01-01T11:00")
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        ("2030-01-01T07:00", "2030-01-01T09:00"),
+        ("2030-01-01T17:00", "2030-01-01T19:00"),
+        ("2030-01-02T11:00", "2030-01-02T12:00"),
+    ],
+)
+def test_pt_trainer_unavailable(member, trainer, start, end):
+    with rejects("trainer_unavailable"):
+        create_pt_session(member, trainer, ROOM, start, end)
+
+
+def test_pt_availability_edges_allowed(member, trainer):
+    create_pt_session(member, trainer, ROOM, "2030-01-01T08:00", "2030-01-01T09:00")
+    create_pt_session(member, trainer, ROOM, "2030-01-01T17:00", "2030-01-01T18:00")
+
+
+def test_pt_room_conflict(member, yoga, other_trainer):
+    set_trainer_availability(other_trainer, "2030-01-01T08:00", "2030-01-01T18:00")
+    with rejects("room_conflict"):
+        create_pt_session(member, other_trainer, ROOM, "2030-01-01T09:30", "2030-01-01T10:30")
+
+
+def test_pt_trainer_conflict(member, yoga, trainer):
+    with rejects("trainer_conflict"):
+        create_pt_session(member, trainer, OTHER_ROOM, "2030-01-01T09:59", "2030-01-01T11:00")
+
+
+def test_pt_touching_class_allowed(member, yoga, trainer):
+    create_pt_session(member, trainer, ROOM, "2030-01-01T10:00", "2030-01-01T11:00")
+
+
+# ---------- room moves ----------
+
+def test_move_class_not_found(app):
+    with rejects("class_not_found"):
+        update_class_session_room(MISSING, ROOM)
+
+
+def test_move_class_room_not_found(yoga):
+    with rejects("room_not_found"):
+        update_class_session_room(yoga, MISSING)
+
+
+def test_move_class_room_conflict(yoga, other_trainer):
+    create_class_session("Spin", other_trainer, OTHER_ROOM, "2030-01-01T09:30", "2030-01-01T10:30", 10)
+    with rejects("room_conflict"):
+        update_class_session_room(yoga, OTHER_ROOM)
+
+
+def test_move_class_ignores_itself(yoga):
+    assert update_class_session_room(yoga, ROOM).room_id == ROOM
+
+
+def test_move_pt_not_found(app):
+    with rejects("pt_not_found"):
+        update_pt_session_room(MISSING, ROOM)
+
+
+def test_move_pt_room_conflict(member, yoga, trainer, other_trainer):
+    pt = create_pt_session(member, trainer, OTHER_ROOM, "2030-01-01T11:00", "2030-01-01T12:00")
+    create_class_session("Spin", other_trainer, ROOM, "2030-01-01T11:30", "2030-01-01T12:30", 10)
+    with rejects("room_conflict"):
+        update_pt_session_room(pt.id, ROOM)
+
+
+def test_move_pt_next_to_booking_allowed(member, yoga, trainer):
+    pt = create_pt_session(member, trainer, OTHER_ROOM, "2030-01-01T10:00", "2030-01-01T11:00")
+    assert update_pt_session_room(pt.id, ROOM).room_id == ROOM
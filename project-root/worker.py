@@ -0,0 +1,172 @@
+"""
+Background job worker.
+
+Claims jobs from the jobs table and runs them in a pool of processes, each
+with its own Flask app and database connections:
+
+    python worker.py --processes 4
+"""
+import argparse
+import logging
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from app import create_app
+from models import db
+
+logger = logging.getLogger("worker")
+
+_app = None
+
+
+def _init_process():
+    global _app
+    _app = create_app()
+
+
+def _run(job_id):
+    from models.jobs import run_job
+
+    with _app.app_context():
+        try:
+            return run_job(job_id)
+        finally:
+            db.session.remove()
+
+
+def _start_pool(app, processes):
+    """
+    Fork a pool of job processes while the parent holds no database
+    connections, so no child inherits a socket or file handle in use.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    pool = ProcessPoolExecutor(max_workers=processes, initializer=_init_process)
+    # with fork the pool starts every child on its first submit; make that
+    # happen now rather than after claim_job() has reconnected
+    pool.submit(os.getpid).result()
+    return pool
+
+
+def _fail(app, job_id, error):
+    from models.jobs import fail_job
+
+    # the child died before it could record the failure itself; fail_job
+    # re-queues the job while it has attempts left
+    logger.error("Job %s crashed: %s", job_id, error)
+    with app.app_context():
+        fail_job(job_id, f"{type(error).__name__}: {error}")
+
+
+def _finish(app, future, job_id):
+    error = future.exception()
+    if error is None:
+        logger.info("Job %s finished: %s", job_id, future.result())
+    else:
+        _fail(app, job_id, error)
+
+
+def _rerun_alone(app, job_ids, processes):
+    """
+    Run the jobs a broken pool was running again, one at a time in a fresh
+    pool, so only a job that brings the pool down on its own is charged the
+    attempt. The others keep the attempt they were claimed with. Returns the
+    pool to carry on with.
+    """
+    pool = _start_pool(app, processes)
+    for job_id in job_ids:
+        logger.info("Rerunning job %s alone", job_id)
+        future = pool.submit(_run, job_id)
+        wait([future])
+        _finish(app, future, job_id)
+        if isinstance(future.exception(), BrokenProcessPool):
+            pool.shutdown(wait=True)
+            pool = _start_pool(app, processes)
+    return pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background jobs.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--poll", type=float, default=2.0, help="seconds between polls when idle")
+    parser.add_argument("--stale-after", type=int, default=3600, help="requeue Running jobs older than this")
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    from models.jobs import claim_job, requeue_stale_jobs
+
+    app = create_app()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    with app.app_context():
+        requeued = requeue_stale_jobs(args.stale_after)
+        if requeued:
+            logger.info("Requeued %s stale jobs", requeued)
+
+    running = {}
+    pool = _start_pool(app, args.processes)
+    try:
+        while True:
+            # jobs a broken pool was running, which may not be at fault, and
+            # jobs it refused before they started
+            suspects = []
+            unstarted = []
+            with app.app_context():
+                while len(running) < args.processes:
+                    job_id = claim_job(worker_id)
+                    if job_id is None:
+                        break
+                    try:
+                        running[pool.submit(_run, job_id)] = job_id
+                    except BrokenProcessPool:
+                        unstarted.append(job_id)
+                        break
+                    logger.info("Started job %s", job_id)
+
+            if not running and not unstarted:
+                if args.once:
+                    break
+                time.sleep(args.poll)
+                continue
+
+            done, _ = wait(running, timeout=args.poll, return_when=FIRST_COMPLETED)
+            for future in done:
+                job_id = running.pop(future)
+                if isinstance(future.exception(), BrokenProcessPool):
+                    suspects.append(job_id)
+                    crash = future.exception()
+                else:
+                    _finish(app, future, job_id)
+
+            if suspects or unstarted:
+                # A child exited abruptly (killed, out of memory). The pool
+                # fails everything it was running and takes no more work.
+                # Any of those jobs could be the cause, so a lone one is
+                # charged the attempt and several are rerun one by one.
+                logger.error("Worker pool broke, restarting it")
+                pool.shutdown(wait=True)
+                for future, job_id in running.items():
+                    if isinstance(future.exception(), BrokenProcessPool):
+                        suspects.append(job_id)
+                        crash = future.exception()
+                    else:
+                        _finish(app, future, job_id)
+                running = {}
+                if len(suspects) == 1:
+                    _fail(app, suspects[0], crash)
+                    suspects = []
+                pool = _rerun_alone(app, unstarted + suspects, args.processes)
+    except KeyboardInterrupt:
+        logger.info("Shutting down, waiting for %s running jobs", len(running))
+    finally:
+        pool.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    main()